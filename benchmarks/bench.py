@@ -0,0 +1,201 @@
+"""Benchmarks of the aggregation pipeline.
+
+Generates synthetic String tables (see generate.py), then times every
+stage (aggregate_all(), aggregate_results(), tableize_aggregated(),
+summary()) and measures its peak memory with tracemalloc. Results are
+compared with the stored baselines (baselines.json), and the run fails
+if a stage is more than --tolerance times slower, or bigger, than its
+baseline, or than the stage it is paired with in PAIRS (the same tables
+built another way, on the same machine). Everything runs offline.
+
+    python benchmarks/bench.py                      # small, compare
+    python benchmarks/bench.py --size medium
+    python benchmarks/bench.py --save-baseline      # update baselines.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE)) # the restring of this checkout
+
+import restring # noqa: E402
+from restring.gears import ( # noqa: E402
+    AggregationResult,
+    aggregate_all,
+    aggregate_results,
+    summary,
+    tableize_aggregated,
+)
+
+from generate import generate # noqa: E402
+
+BASELINES = os.path.join(HERE, "baselines.json")
+
+# number of comparison folders
+SIZES = {
+    "small": 20,
+    "medium": 200,
+    "large": 2000,
+}
+
+# (stage, reference): the stage must not be more than --tolerance times
+# slower than its reference, measured in the same run. summary() of the
+# records must decode the gene sets in one go, as the lazy result does
+PAIRS = [
+    ("summary", "summary[lazy]"),
+]
+
+
+def measure(func, repeat=3):
+    """Runs <func> <repeat> times and returns (its result, best wall time
+    in seconds, peak memory in bytes). Memory is measured in a separate
+    run, as tracemalloc slows things down.
+    """
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, min(times), peak
+
+
+def run(size="small", repeat=3, seed=0):
+    """Returns {stage: {"seconds", "peak_bytes"}} for the given size."""
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="restring-bench-") as path:
+        dirs = generate(path, SIZES[size], seed=seed)
+
+        def stage(name, func):
+            result, seconds, peak = measure(func, repeat)
+            results[name] = {"seconds": round(seconds, 4), "peak_bytes": int(peak)}
+            print(f"{name:<28} {seconds:9.3f} s {peak / 2**20:10.1f} MB")
+            return result
+
+        aggregated = stage(
+            "aggregate_all",
+            lambda: aggregate_all(dirs, verbose=False, PATH=path),
+        )
+        stage(
+            "aggregate_results[Process]",
+            lambda: aggregate_results(dirs, kind="Process", verbose=False, PATH=path),
+        )
+        db = aggregated[("UP", "DOWN"), "Process"]
+        stage("tableize_aggregated", lambda: tableize_aggregated(db))
+        stage("summary", lambda: summary(db))
+
+        # a new AggregationResult every time, as its tables are memoized
+        lazy = aggregate_results(dirs, kind="Process", verbose=False, PATH=path, lazy=True)
+        stage("summary[lazy]", lambda: summary(AggregationResult(lazy.aggregate)))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the <list> of regressions of <results> over <baseline>."""
+
+    regressions = []
+    for name, now in results.items():
+        then = baseline.get(name)
+        if then is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if then[metric] > 0 and now[metric] > then[metric] * tolerance:
+                regressions.append(
+                    f"{name}: {metric} {now[metric]} is more than {tolerance}x "
+                    f"the baseline ({then[metric]})"
+                )
+    return regressions
+
+
+def compare_pairs(results, tolerance):
+    """Returns the <list> of stages of PAIRS that are more than <tolerance>
+    times slower than their reference.
+    """
+
+    regressions = []
+    for name, reference in PAIRS:
+        if name not in results or reference not in results:
+            continue
+        now, then = results[name]["seconds"], results[reference]["seconds"]
+        if then > 0 and now > then * tolerance:
+            regressions.append(
+                f"{name}: seconds {now} is more than {tolerance}x "
+                f"{reference} ({then})"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the restring aggregation pipeline.")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tolerance", type=float, default=2.0,
+        help="fail if a stage takes more than this times its baseline (default: 2.0)"
+    )
+    parser.add_argument("--baselines", default=BASELINES, help="baselines .json file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--json", default=None, help="also write the results to this .json file")
+    args = parser.parse_args(argv)
+
+    print(f"restring {restring.__version__}, Python {platform.python_version()}, "
+          f"{SIZES[args.size]} comparison folders\n")
+    results = run(args.size, args.repeat, args.seed)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"size": args.size, "stages": results}, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[args.size] = results
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline for '{args.size}' saved in {args.baselines}")
+        return 0
+
+    regressions = compare_pairs(results, args.tolerance)
+    if args.size in baselines:
+        regressions += compare(results, baselines[args.size], args.tolerance)
+    else:
+        print(f"\nNo baseline for '{args.size}': nothing to compare.")
+
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print(f"\nNo regressions (tolerance {args.tolerance}x).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Synthetic String enrichment tables for the benchmarks.
+
+Writes <n_dirs> comparison folders, each one with UP_ and DOWN_
+enrichment.<kind>.tsv files laid out like the ones String gives (see
+sample_output/). Numbers of terms per file, genes per term and false
+discovery rates are drawn from distributions that match the sample
+data; terms and genes are drawn from fixed pools, so that the same terms
+and genes show up in many comparisons, as in real experiments.
+
+    python benchmarks/generate.py <path> --dirs 200
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+# per kind: size of the term pool, median terms per file, median genes
+# per term. From sample_output/ and the size of the String databases
+KINDS = {
+    "Component": (1800, 30, 20),
+    "Function": (4500, 50, 11),
+    "KEGG": (350, 20, 11),
+    "Process": (15000, 255, 13),
+    "RCTM": (2500, 5, 8),
+}
+
+# share of the comparison folders that have a table of a kind and direction
+# (String does not write empty tables)
+FILE_PROBABILITY = 0.85
+
+HEADER = [
+    "#term ID",
+    "term description",
+    "observed gene count",
+    "background gene count",
+    "false discovery rate",
+    "matching proteins in your network (IDs)",
+    "matching proteins in your network (labels)",
+]
+
+
+def _lognormal_counts(rng, median, size, sigma=1.1, high=None):
+    counts = np.rint(rng.lognormal(np.log(median), sigma, size)).astype(int)
+    return np.clip(counts, 1, high)
+
+
+def generate(path, n_dirs=20, kinds=KINDS, n_genes=20000, seed=0, scale=1.0):
+    """Writes the synthetic folders in <path>, and returns their names.
+
+    scale multiplies the number of terms per file.
+    """
+
+    rng = np.random.default_rng(seed)
+    genes = np.array([f"Gene{i}" for i in range(n_genes)], dtype=object)
+    proteins = np.array([f"10090.ENSMUSP{i:011d}" for i in range(n_genes)], dtype=object)
+
+    # every term has its own pool of genes, so that a term found in many
+    # comparisons shares part of its genes among them
+    pools = {}
+    popularity = {}
+    for kind, (n_terms, _, genes_median) in kinds.items():
+        sizes = _lognormal_counts(rng, genes_median * 3, n_terms, high=n_genes)
+        pools[kind] = [rng.choice(n_genes, size, replace=False) for size in sizes]
+        weights = 1 / np.arange(1, n_terms + 1) # a few terms come up very often
+        popularity[kind] = weights / weights.sum()
+
+    os.makedirs(path, exist_ok=True)
+    names = []
+    for d in range(n_dirs):
+        name = f"cond_{d:05d}_VS_ctrl_FC"
+        names.append(name)
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+
+        for kind, (n_terms, terms_median, genes_median) in kinds.items():
+            for direction in ("UP", "DOWN"):
+                if rng.random() > FILE_PROBABILITY:
+                    continue
+
+                n = int(_lognormal_counts(rng, terms_median * scale, 1, high=n_terms)[0])
+                terms = rng.choice(n_terms, n, replace=False, p=popularity[kind])
+                fdr = 10 ** -rng.exponential(2.5, n)
+                order = np.argsort(fdr, kind="stable")
+
+                lines = ["\t".join(HEADER)]
+                for t, score in zip(terms[order], fdr[order]):
+                    pool = pools[kind][t]
+                    k = int(min(_lognormal_counts(rng, genes_median, 1)[0], len(pool)))
+                    matched = np.sort(rng.choice(pool, k, replace=False))
+                    lines.append("\t".join((
+                        f"{kind}:{t:06d}",
+                        f"{kind} term {t}",
+                        str(k),
+                        str(len(pool) * 5),
+                        f"{score:.3g}",
+                        ",".join(proteins[matched]),
+                        ",".join(genes[matched]),
+                    )))
+
+                outfile = os.path.join(path, name, f"{direction}_enrichment.{kind}.tsv")
+                with open(outfile, "w") as f:
+                    f.write("\n".join(lines) + "\n")
+
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes synthetic String enrichment tables.")
+    parser.add_argument("path", help="where the comparison folders are written")
+    parser.add_argument("--dirs", type=int, default=20, help="number of comparison folders")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the terms per file")
+    args = parser.parse_args(argv)
+
+    names = generate(args.path, args.dirs, seed=args.seed, scale=args.scale)
+    print(f"Wrote {len(names)} comparison folders in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,10 +13,14 @@ from restring.gears import (
     manzlog,
     get_dirs,
     aggregate_results,
+    aggregate_all,
     tableize_aggregated,
     summary,
+    read_enrichment_table,
     write_all_aggregated,
     write_all_summarized,
+    write_partial_aggregates,
+    write_gene_index,
     keep_start,
     keep_end,
     keep_inside,
@@ -27,6 +31,15 @@ from restring.gears import (
     draw_clustermap,
     draw_bubbleplot,
     Aggregation,
+    GeneVocabulary,
+    GeneSet,
+    TermRecord,
+    PartialAggregate,
+    AggregationResult,
+    GeneIndex,
+    Report,
+    Progress,
+    ProgressEvent,
 
     # String API
     session_ID,
@@ -35,12 +48,41 @@ from restring.gears import (
     remap_identifiers,
 )
 
+from restring.apigears import (
+    EnrichmentClient,
+    TokenBucket,
+    ResponseCache,
+    string_version,
+    fetch_all,
+    coalesce,
+    StringAPIError,
+    CircuitOpenError,
+    CircuitBreaker,
+)
+
 from restring.settings import(
     file_types,
     API_file_types,
     header_table, 
     sep,
-    PATH
+    PATH,
+    read_engine,
+    progress_interval,
+    string_api_url,
+    api_pool_size,
+    api_timeout,
+    api_rate,
+    api_burst,
+    api_workers,
+    api_cache_dir,
+    api_cache_size,
+    api_cache_ttl,
+    api_retries,
+    api_backoff,
+    api_backoff_max,
+    api_breaker_threshold,
+    api_breaker_cooldown,
+    api_retry_rounds,
 )
 
 __all__ = (
@@ -49,10 +91,14 @@ __all__ = (
     "manzlog",
     "get_dirs",
     "aggregate_results",
+    "aggregate_all",
     "tableize_aggregated",
     "summary",
+    "read_enrichment_table",
     "write_all_aggregated",
     "write_all_summarized",
+    "write_partial_aggregates",
+    "write_gene_index",
     "keep_start",
     "keep_end",
     "keep_inside",
@@ -63,17 +109,52 @@ __all__ = (
     "draw_clustermap",
     "draw_bubbleplot",
     "Aggregation",
+    "GeneVocabulary",
+    "GeneSet",
+    "TermRecord",
+    "PartialAggregate",
+    "AggregationResult",
+    "GeneIndex",
+    "Report",
+    "Progress",
+    "ProgressEvent",
 
     # String API
     "session_ID",
     "get_functional_enrichment",
     "write_functional_enrichment_tables",
     "remap_identifiers",
+    "EnrichmentClient",
+    "TokenBucket",
+    "ResponseCache",
+    "string_version",
+    "fetch_all",
+    "coalesce",
+    "StringAPIError",
+    "CircuitOpenError",
+    "CircuitBreaker",
     
     # settings
     "file_types",
     "API_file_types",
     "header_table", 
     "sep",
-    "PATH"
+    "PATH",
+    "read_engine",
+    "progress_interval",
+    "string_api_url",
+    "api_pool_size",
+    "api_timeout",
+    "api_rate",
+    "api_burst",
+    "api_workers",
+    "api_cache_dir",
+    "api_cache_size",
+    "api_cache_ttl",
+    "api_retries",
+    "api_backoff",
+    "api_backoff_max",
+    "api_breaker_threshold",
+    "api_breaker_cooldown",
+    "api_retry_rounds",
 )
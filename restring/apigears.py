@@ -0,0 +1,711 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from io import StringIO
+from random import uniform
+from time import time, monotonic, sleep
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from .settings import (
+    string_api_url,
+    api_pool_size,
+    api_timeout,
+    api_rate,
+    api_burst,
+    api_workers,
+    api_cache_dir,
+    api_cache_size,
+    api_cache_ttl,
+    api_retries,
+    api_backoff,
+    api_backoff_max,
+    api_breaker_threshold,
+    api_breaker_cooldown,
+    api_retry_rounds,
+)
+
+
+# errors ===============================================================
+
+class StringAPIError(RuntimeError):
+
+    """A query STRING did not answer. <retryable> if it may work later
+    (the server is busy or down), and then <retry_after> seconds to wait
+    at least, if known.
+    """
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(StringAPIError):
+
+    """Not sent: STRING failed too many times in a row (see CircuitBreaker)."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            f"STRING looks down: not asking again for {round(retry_after, 1)} seconds.",
+            retryable=True, retry_after=retry_after,
+        )
+
+
+def _reply_error(response, output_format):
+    """The StringAPIError of a reply, or None if it is a proper answer.
+    STRING tells what went wrong in the body, also with HTTP 200.
+    """
+
+    message = None
+    if output_format == "tsv":
+        header = response.text.split("\n", 1)[0].strip().lower().split("\t")
+        if header[0] == "error" or "message" in header or "errormessage" in header:
+            message = " ".join(response.text.strip().split("\n")[1:]) or header[0]
+
+    status = response.status_code
+    if status == 200 and message is None:
+        return None
+
+    retry_after = response.headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after)
+    except (TypeError, ValueError):
+        retry_after = None
+
+    if message is None:
+        message = response.text.strip()[:200] or response.reason
+    return StringAPIError(
+        f"STRING replied {status}: {message}", status=status,
+        retryable=status == 429 or status >= 500, retry_after=retry_after,
+    )
+
+
+# rate limiting ===============================================================
+
+class TokenBucket:
+
+    """Thread-safe token bucket: acquire() waits until a token is there.
+    Tokens come at <rate> per second, and up to <burst> of them pile up
+    while nobody takes them. With rate=None, acquire() never waits.
+    """
+
+    def __init__(self, rate=api_rate, burst=api_burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst})"
+
+
+    def acquire(self):
+        if not self.rate:
+            return
+
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            sleep(wait_time)
+
+
+class CircuitBreaker:
+
+    """Thread-safe circuit breaker. After <threshold> failures in a row,
+    allow() raises CircuitOpenError for <cooldown> seconds; then one query
+    is let through to try, and the next ones wait for how it goes.
+    """
+
+    def __init__(self, threshold=api_breaker_threshold, cooldown=api_breaker_cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened = None
+        self._trying = False
+        self._lock = threading.Condition()
+
+
+    def __repr__(self):
+        return f"CircuitBreaker(threshold={self.threshold}, cooldown={self.cooldown})"
+
+
+    @property
+    def open(self):
+        with self._lock:
+            return self._opened is not None
+
+
+    def allow(self):
+        with self._lock:
+            while self._opened is not None:
+                left = self._opened + self.cooldown - monotonic()
+                if left > 0:
+                    raise CircuitOpenError(left)
+                if not self._trying:
+                    self._trying = True
+                    return
+                self._lock.wait()
+
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trying = False
+            self._lock.notify_all()
+
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trying or self._failures >= self.threshold:
+                self._opened = monotonic()
+            self._trying = False
+            self._lock.notify_all()
+
+
+    def cancel(self):
+        """The query let through by allow() ended without STRING answering
+        or failing (it raised something else): the next one tries instead.
+        """
+
+        with self._lock:
+            self._trying = False
+            self._lock.notify_all()
+
+
+# response cache ===============================================================
+
+_VERSION_URL = re.compile(r"version-(\d+)-(\d+)")
+
+
+def string_version(string_api_url):
+    """The STRING version an API address points to: "11.5" for
+    https://version-11-5.string-db.org/api, "latest" for the others.
+    """
+
+    match = _VERSION_URL.search(string_api_url)
+    if match is None:
+        return "latest"
+    return ".".join(match.groups())
+
+
+class ResponseCache:
+
+    """On-disk cache of STRING replies, one file per query in <path>.
+
+    Queries are addressed by a hash of what makes their reply: the API
+    address and method, the species, the genes and the background (both
+    regardless of their order), and the other parameters. The least
+    recently used replies are dropped when the cache grows over
+    <max_bytes>. Replies from the latest STRING release are kept for <ttl>
+    seconds, the ones from a given STRING version until dropped (see
+    string_version()).
+
+    hits and misses count the lookups since the cache was made. A folder
+    that can't be written to just means no cache.
+
+    Params:
+    =======
+    path:      <str> folder of the cache (settings.api_cache_dir)
+
+    max_bytes: <int> size of the cache (settings.api_cache_size)
+
+    ttl:       <float> seconds, or None (settings.api_cache_ttl)
+    """
+
+    suffix = ".json"
+
+    def __init__(self, path=api_cache_dir, max_bytes=api_cache_size, ttl=api_cache_ttl):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = None  # {key: bytes}, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+
+    def __repr__(self):
+        return f"ResponseCache({self.path!r}, max_bytes={self.max_bytes}, ttl={self.ttl})"
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+
+    @staticmethod
+    def key(method, string_api_url, species, genes, background=None, **params):
+        """The address of a query: <genes> and <background> are sets."""
+
+        query = {
+            "method": method,
+            "url": string_api_url.rstrip("/"),
+            "species": str(species),
+            "genes": sorted(set(str(gene) for gene in genes)),
+            "background": None if background is None else sorted(set(str(gene) for gene in background)),
+            "params": {k: str(v) for k, v in sorted(params.items())},
+        }
+        h = hashlib.blake2b(json.dumps(query).encode(), digest_size=16)
+        return h.hexdigest()
+
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+
+    def _load(self):
+        # the files already there, oldest used first. Call with the lock
+        if self._entries is None:
+            found = []
+            if os.path.isdir(self.path):
+                for entry in os.scandir(self.path):
+                    if entry.name.endswith(self.suffix):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name[:-len(self.suffix)], stat.st_size))
+            found.sort()
+            self._entries = {key: size for _, key, size in found}
+            self._bytes = sum(self._entries.values())
+        return self._entries
+
+
+    def _drop(self, key):
+        # call with the lock
+        self._bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+
+    def get(self, key):
+        """The reply stored at <key>, or None if missing or expired."""
+
+        with self._lock:
+            entries = self._load()
+            text = None
+            if key in entries:
+                try:
+                    with open(self._file(key), encoding="utf-8") as f:
+                        stored = json.load(f)
+                    expired = (
+                        stored["version"] == "latest" and self.ttl is not None
+                        and time() - stored["created"] > self.ttl
+                    )
+                    if expired:
+                        self._drop(key)
+                    else:
+                        text = stored["text"]
+                        # last used: to the end of the line, also on disk
+                        entries[key] = entries.pop(key)
+                        os.utime(self._file(key))
+                except (OSError, ValueError, KeyError):
+                    self._drop(key)
+
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return text
+
+
+    def put(self, key, text, string_api_url):
+        """Stores the reply <text> at <key>, and makes room for it."""
+
+        data = json.dumps({
+            "version": string_version(string_api_url),
+            "created": time(),
+            "text": text,
+        }).encode("utf-8")
+
+        with self._lock:
+            entries = self._load()
+            outfile = self._file(key)
+            tempfile = f"{outfile}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                with open(tempfile, "wb") as f:
+                    f.write(data)
+                os.replace(tempfile, outfile)
+            except OSError:
+                if os.path.exists(tempfile):
+                    os.remove(tempfile)
+                return
+
+            self._bytes -= entries.pop(key, 0)
+            entries[key] = len(data)
+            self._bytes += len(data)
+            for old in list(entries):
+                if self._bytes <= self.max_bytes or old == key:
+                    break
+                self._drop(old)
+
+
+    def clear(self):
+        """Removes all the replies stored."""
+
+        with self._lock:
+            for key in list(self._load()):
+                self._drop(key)
+
+
+    def stats(self):
+        """{"hits", "misses", "entries", "bytes"} of the cache."""
+
+        with self._lock:
+            entries = self._load()
+            return {
+                "hits": self.hits, "misses": self.misses,
+                "entries": len(entries), "bytes": self._bytes,
+            }
+
+
+# STRING API client ===============================================================
+
+class EnrichmentClient:
+
+    """Talks to the STRING API (https://string-db.org/help//api/) over a
+    single requests.Session: connections to each STRING server are kept
+    alive and reused by every query, instead of opening a new TCP and TLS
+    connection each time, and replies are transferred compressed.
+
+    One client can be shared by many threads. Use it as a context manager,
+    or call close(), to close the connections when done:
+
+    with EnrichmentClient() as client:
+        df = get_functional_enrichment(genes, species=10090, client=client)
+
+    Params:
+    =======
+    string_api_url: the STRING API address, for all the queries that
+               do not give their own (settings.string_api_url)
+
+    pool_size: <int> connections kept open to each STRING server
+               (settings.api_pool_size)
+
+    timeout:   seconds to wait for STRING to (connect, reply)
+               (settings.api_timeout)
+
+    rate, burst: queries are sent at most <rate> per second, by all the
+               threads together (settings.api_rate, settings.api_burst;
+               see TokenBucket)
+
+    cache:     a ResponseCache the enrichments are looked up in before
+               asking STRING; True: the one in settings.api_cache_dir (if
+               not None); None or False (default): no cache, nothing is
+               written to disk
+
+    retries, backoff, backoff_max: how many times, and after how long,
+               queries are tried again (settings.api_retries,
+               settings.api_backoff, settings.api_backoff_max)
+
+    breaker:   a CircuitBreaker, or None for one with settings.api_breaker_threshold
+               and settings.api_breaker_cooldown
+    """
+
+    def __init__(self, string_api_url=string_api_url, pool_size=api_pool_size,
+                 timeout=api_timeout, rate=api_rate, burst=api_burst, cache=False,
+                 retries=api_retries, backoff=api_backoff, backoff_max=api_backoff_max,
+                 breaker=None):
+        self.string_api_url = string_api_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+
+        if cache is True:
+            cache = None if api_cache_dir is None else ResponseCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+    def __repr__(self):
+        return f"EnrichmentClient({self.string_api_url!r}, pool_size={self.pool_size})"
+
+
+    def close(self):
+        self.session.close()
+
+
+    def _delay(self, attempt, retry_after=None):
+        # exponential backoff, with jitter; never less than STRING asked
+        longest = min(self.backoff_max, self.backoff * 2 ** attempt)
+        return max(longest / 2 + uniform(0, longest / 2), retry_after or 0)
+
+
+    def request(self, method, params, output_format="tsv", string_api_url=None):
+        """POSTs <params> to the <method> of the STRING API. Failures that
+        may go away are tried again (see EnrichmentClient).
+
+        Returns: the requests.Response
+        Raises:  StringAPIError, if STRING did not answer
+        """
+
+        if string_api_url is None:
+            string_api_url = self.string_api_url
+        request_url = "/".join([string_api_url, output_format, method])
+
+        for attempt in range(self.retries + 1):
+            self.breaker.allow()
+            try:
+                self.limiter.acquire()
+                response = self.session.post(request_url, data=params, timeout=self.timeout)
+                error = _reply_error(response, output_format)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = StringAPIError(f"STRING did not reply: {e}", retryable=True)
+            except requests.RequestException as e:
+                error = StringAPIError(f"Could not ask STRING: {e}")
+            except BaseException:
+                # otherwise the threads waiting for this query would wait forever
+                self.breaker.cancel()
+                raise
+
+            if error is None or not error.retryable:
+                # STRING is up, even if it did not like the query
+                self.breaker.success()
+                if error is None:
+                    return response
+                raise error
+
+            self.breaker.failure()
+            if attempt == self.retries:
+                raise error
+            sleep(self._delay(attempt, error.retry_after))
+
+
+    def enrichment(self, genes, species, caller_ID, statistical_background=None,
+                   allow_pubmed=0, string_api_url=None):
+        """Functional enrichment of <genes> (see get_functional_enrichment()).
+
+        Returns: <pd.DataFrame> of the enrichment, as STRING replied it.
+        """
+
+        params = {
+            "identifiers" : "%0d".join(genes), # your proteins
+            "species" : species,               # species NCBI identifier 
+            "caller_identity" : caller_ID,     # your app name
+            "allow_pubmed": allow_pubmed,      # this just seems to be ignored
+        }
+        if statistical_background is not None:
+            params["background_string_identifiers"] = "%0d".join(statistical_background)
+
+        if string_api_url is None:
+            string_api_url = self.string_api_url
+
+        text = None
+        if self.cache is not None:
+            key = self.cache.key(
+                "enrichment", string_api_url, species, genes, statistical_background,
+                allow_pubmed=allow_pubmed,
+            )
+            text = self.cache.get(key)
+
+        if text is None:
+            text = self.request("enrichment", params, string_api_url=string_api_url).text
+            if self.cache is not None:
+                self.cache.put(key, text, string_api_url)
+
+        return pd.read_csv(StringIO(text.strip()), sep="\t", index_col=0)
+
+
+    def string_ids(self, identifiers, species, caller_ID, string_api_url=None):
+        """Maps <identifiers> to STRING identifiers: the best match of each.
+        See https://string-db.org/cgi/help.pl?subpage=api%23mapping-identifiers
+
+        Returns: <list> of the STRING identifiers.
+        """
+
+        params = {
+            "identifiers" : "\r".join(identifiers), # your protein list
+            "species" : species,
+            "limit" : 1, # only one (best) identifier per input protein
+            "echo_query" : 1, # see your input identifiers in the output
+            "caller_identity" : caller_ID,
+        }
+
+        response = self.request(
+            "get_string_ids", params, output_format="tsv-no-header",
+            string_api_url=string_api_url,
+        )
+        return [line.split("\t")[2] for line in response.text.strip().split("\n")]
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    """The EnrichmentClient shared by all the calls that are not given one."""
+
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = EnrichmentClient()
+        return _default_client
+
+
+# concurrent queries ===============================================================
+
+def coalesce(queries, key):
+    """Groups the <queries> that have the same key(query), so that each
+    different query is sent once, and its reply given to all of them.
+
+    Returns: <list> of the groups (<list> of queries), in the order their
+    first query comes in <queries>.
+    """
+
+    groups = {}
+    for query in queries:
+        groups.setdefault(key(query), []).append(query)
+    return list(groups.values())
+
+
+def _pause(seconds, idle, interval):
+    # sleeps, calling idle() at least every <interval> seconds
+    end = monotonic() + seconds
+    while True:
+        if idle is not None:
+            idle()
+        left = end - monotonic()
+        if left <= 0:
+            return
+        sleep(min(interval, left))
+
+
+def _fetch_pass(queries, run, workers, idle, interval, parked):
+    # one go over <queries> (see fetch_all()); the ones failing with a
+    # StringAPIError go to <parked>, if it is a list
+
+    if workers is None or workers <= 1:
+        for query in queries:
+            try:
+                result = run(query)
+            except StringAPIError as error:
+                if parked is None:
+                    raise
+                parked.append((query, error))
+                continue
+            yield query, result
+        return
+
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for query in queries:
+            pending[executor.submit(run, query)] = query
+        while len(pending) > 0:
+            done, _ = wait(pending, timeout=interval, return_when=FIRST_COMPLETED)
+            if idle is not None:
+                idle()
+            for future in done:
+                query = pending.pop(future)
+                try:
+                    result = future.result()
+                except StringAPIError as error:
+                    if parked is None:
+                        raise
+                    parked.append((query, error))
+                    continue
+                yield query, result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def fetch_all(queries, fetch, workers=api_workers, limiter=None, idle=None, interval=0.1,
+              failed=None, rounds=api_retry_rounds, backoff=api_backoff):
+    """Runs fetch(query) for every query of <queries>, in a pool of
+    <workers> threads, so that <workers> queries are in flight at once.
+
+    Yields (query, result) in the order they complete. The results are
+    used in the calling thread, that can safely write them anywhere. If a
+    fetch() raises, the exception is raised here, and the queries not
+    started yet are dropped.
+
+    Params:
+    =======
+    workers:  <int>; with None or 1, queries are run one after the other,
+              in the calling thread
+
+    limiter:  a TokenBucket, taken from before every query (on top of the
+              rate limit of the EnrichmentClient)
+
+    idle:     called (with no arguments) at least every <interval>
+              seconds while waiting, in the calling thread; the GUI uses
+              it to keep the window alive
+
+    failed:   <list>, or None. If a list, a query failing with a
+              StringAPIError does not stop the others: it is put aside,
+              and if it may work later, run again once the others are
+              done, until <rounds> rounds in a row get none of them
+              through (settings.api_retry_rounds). The queries still
+              failing are appended to <failed> as (query, StringAPIError)
+
+    backoff:  <float> seconds waited before every round of retries, or
+              longer if STRING asked so; pass the backoff of the
+              EnrichmentClient the queries go through (settings.api_backoff)
+    """
+
+    def run(query):
+        if limiter is not None:
+            limiter.acquire()
+        return fetch(query)
+
+    parked = None if failed is None else []
+    yield from _fetch_pass(queries, run, workers, idle, interval, parked)
+    if failed is None:
+        return
+
+    stuck = 0
+    while stuck < rounds:
+        retry = [(query, error) for query, error in parked if error.retryable]
+        if len(retry) == 0:
+            break
+        parked = [(query, error) for query, error in parked if not error.retryable]
+        _pause(max([backoff] + [error.retry_after or 0 for _, error in retry]), idle, interval)
+
+        yield from _fetch_pass([query for query, _ in retry], run, workers, idle, interval, parked)
+        left = sum(error.retryable for _, error in parked)
+        stuck = stuck + 1 if left == len(retry) else 0
+
+    failed.extend(parked)
@@ -1,23 +1,38 @@
 import os
+import sys
+import json
+import hashlib
+import tempfile
+import numpy as np
 import pandas as pd
+from collections import deque, namedtuple
+from collections.abc import Set, MutableMapping
 from os.path import isdir
 from math import log
 from io import StringIO
-from glob import glob
+from glob import glob, escape
 import requests
 from io import StringIO
 from random import choice
-from time import time, sleep
+from time import time, sleep, perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from queue import SimpleQueue, Empty
+from threading import Lock
 from matplotlib import pyplot as plt
 import seaborn as sns
 
 
+from .apigears import EnrichmentClient, TokenBucket, default_client, fetch_all, coalesce
+
 from .settings import (
     file_types,
     API_file_types,
     header_table,
     sep,
-    PATH
+    PATH,
+    read_engine,
+    progress_interval,
+    api_workers,
 )
 
 
@@ -40,14 +55,14 @@ def manzlog(numlike, base=2, err=0):
         return err
 
 
-def get_dirs():
-    """retrieves all folders in current path, then keeps or discards
-    them based on input parameters. Folders starting with "__" and "."
-    are discarded
+def get_dirs(path="."):
+    """retrieves all folders in <path> (defaults to the current path), then
+    keeps or discards them based on input parameters. Folders starting with
+    "__" and "." are discarded
     """
 
-    dirs = sorted(os.listdir("."))
-    dirs = [x for x in dirs if isdir(x)]
+    dirs = sorted(os.listdir(path))
+    dirs = [x for x in dirs if isdir(os.path.join(path, x))]
     dirs = [x for x in dirs if not x.startswith("__") and not x.startswith(".")]
     return dirs
 
@@ -206,28 +221,2540 @@ def keep_inside(listlike, wanted):
     any of the identifiers contained in <terms>
     """
 
-    if isinstance(wanted, str):
-        wanted = [wanted]
+    if isinstance(wanted, str):
+        wanted = [wanted]
+
+    returnlist = []
+    for x in listlike:
+        for y in wanted:
+            if y in x:
+                returnlist.append(x)
+                break
+
+    return returnlist
+
+
+# ===============================================================
+
+# ===============================================================
+
+# instrumentation ===============================================================
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+def _peak_rss():
+    """Peak resident memory of this process so far, in bytes (None if it
+    can not be known on this system).
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak # bytes
+    return peak * 1024 # kilobytes
+
+
+class _Stage:
+
+    """Context manager that times one stage, then adds its record to the
+    report. The record (a <dict>) can be updated inside the 'with' block.
+    """
+
+    __slots__ = ("report", "record", "start")
+
+    def __init__(self, report, record):
+        self.report = report
+        self.record = record
+
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self.record
+
+
+    def __exit__(self, *exc):
+        self.record["seconds"] = perf_counter() - self.start
+        self.record["peak_rss"] = _peak_rss()
+        self.report.records.append(self.record)
+        return False
+
+
+class Report:
+
+    """Collects wall time, rows, bytes and peak resident memory (RSS) of
+    every stage of an aggregation: reading each file and directory,
+    aggregating, finding the common genes, building the records,
+    tableizing, summarizing and writing.
+
+    Pass the same Report to the functions to be measured, for example:
+
+    report = Report()
+    aggregated = aggregate_all(directories, report=report)
+    write_all_summarized(directories, aggregated=aggregated, report=report)
+    print(report)
+    report.save("report.json")
+
+    When no report is given, functions use a do-nothing one, that costs
+    close to nothing.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.records = []
+
+
+    def stage(self, stage, name=None, rows=None, nbytes=None):
+        """Times the 'with' block as one record of <stage>:
+
+        with report.stage("summary", name="KEGG") as record:
+            ...
+            record["rows"] = len(table)
+        """
+
+        return _Stage(self, {
+            "stage": stage, "name": name, "seconds": None,
+            "rows": rows, "bytes": nbytes, "peak_rss": None,
+        })
+
+
+    def add(self, stage, name=None, seconds=None, rows=None, nbytes=None, **extra):
+        """Adds a record measured elsewhere (like in a worker process)."""
+
+        record = {
+            "stage": stage, "name": name, "seconds": seconds,
+            "rows": rows, "bytes": nbytes, "peak_rss": _peak_rss(),
+        }
+        record.update(extra)
+        self.records.append(record)
+
+
+    def extend(self, records):
+        """Adds the records of another Report (like the one of a worker
+        process).
+        """
+
+        self.records.extend(records)
+
+
+    def totals(self):
+        """Returns {stage: {"count", "seconds", "rows", "bytes", "peak_rss"}},
+        with stages in the order they first ran.
+        """
+
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {
+                "count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "peak_rss": None
+            })
+            total["count"] += 1
+            for key in ("seconds", "rows", "bytes"):
+                if record[key] is not None:
+                    total[key] += record[key]
+            if record["peak_rss"] is not None:
+                total["peak_rss"] = max(total["peak_rss"] or 0, record["peak_rss"])
+        return totals
+
+
+    def to_dict(self):
+        return {"totals": self.totals(), "records": self.records}
+
+
+    def table(self):
+        """Returns the records as a <pd.DataFrame>."""
+
+        return pd.DataFrame(self.records, columns=["stage", "name", "seconds", "rows", "bytes", "peak_rss"])
+
+
+    def save(self, file):
+        """Writes the report to <file>, as JSON."""
+
+        with open(file, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+    def __str__(self):
+        lines = [f"{'stage':<16}{'count':>7}{'seconds':>11}{'rows':>12}{'MB read':>10}{'peak RSS MB':>13}"]
+        for stage, total in self.totals().items():
+            peak = "" if total["peak_rss"] is None else f"{total['peak_rss'] / 2**20:.1f}"
+            lines.append(
+                f"{stage:<16}{total['count']:>7}{total['seconds']:>11.3f}{total['rows']:>12}"
+                f"{total['bytes'] / 2**20:>10.1f}{peak:>13}"
+            )
+        return "\n".join(lines)
+
+
+class _NoReport:
+
+    """Stands in for a Report when none is given: records nothing."""
+
+    enabled = False
+    records = ()
+
+    def stage(self, stage, name=None, rows=None, nbytes=None):
+        return _NO_STAGE
+
+
+    def add(self, *args, **kwargs):
+        pass
+
+
+    def extend(self, records):
+        pass
+
+
+class _NoStage:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return {} # thrown away
+
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_REPORT = _NoReport()
+_NO_STAGE = _NoStage()
+
+
+# progress events ===============================================================
+
+# <message> is what would have been printed (without <end>); <stage>,
+# <name> (the file or directory), <done> and <total> are there when known
+ProgressEvent = namedtuple(
+    "ProgressEvent", ["stage", "message", "name", "done", "total", "end", "time"]
+)
+
+
+class Progress:
+
+    """Thread-safe queue of progress events.
+
+    The library functions that take progress= post here, as ProgressEvent
+    tuples, what they would otherwise print: the message, and the stage,
+    file or directory and counts it belongs to. Whoever shows them (for
+    example, the GUI) drains the queue at its own pace, for example:
+
+    progress = Progress()
+    aggregate_all(directories, progress=progress)
+    for event in progress.drain():
+        print(event.message, end=event.end)
+
+    Params:
+    =======
+    interval: <float> seconds; due() is True at most this often
+              (settings.progress_interval)
+
+    callback: if given, it is called (with no arguments) after an event is
+              posted, at most once every <interval> seconds. It is called
+              from the thread that posts the event.
+    """
+
+    def __init__(self, interval=progress_interval, callback=None):
+        self.interval = interval
+        self.callback = callback
+        self._events = SimpleQueue()
+        self._lock = Lock()
+        self._last = 0.0
+
+
+    def post(self, message="", stage=None, name=None, done=None, total=None, end="\n"):
+        """Adds one event to the queue."""
+
+        self._events.put(
+            ProgressEvent(stage, message, name, done, total, end, perf_counter())
+        )
+        if self.callback is not None and self.due():
+            self.callback()
+
+
+    def due(self):
+        """True if at least <interval> seconds went by since it last was."""
+
+        now = perf_counter()
+        with self._lock:
+            if now - self._last < self.interval:
+                return False
+            self._last = now
+            return True
+
+
+    def drain(self, limit=None):
+        """Takes out of the queue, and returns, the events posted so far
+        (at most <limit> of them, if given), oldest first.
+        """
+
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._events.get_nowait())
+            except Empty:
+                break
+        return events
+
+
+    def empty(self):
+        return self._events.empty()
+
+
+def _sayer(verbose=True, progress=None):
+    """Returns the say() of the library functions: it posts its message to
+    <progress> if given (see Progress), or else prints it if <verbose>.
+    """
+
+    if progress is not None:
+        def say(*args, sep=" ", end="\n", stage=None, name=None, done=None, total=None):
+            progress.post(
+                sep.join(str(x) for x in args), stage=stage, name=name,
+                done=done, total=total, end=end,
+            )
+    elif verbose:
+        def say(*args, sep=" ", end="\n", stage=None, name=None, done=None, total=None):
+            print(*args, sep=sep, end=end)
+    else:
+        def say(*args, **kwargs):
+            pass
+
+    return say
+
+
+# gene sets ===============================================================
+
+# int.bit_count() is only there since Python 3.10
+if hasattr(int, "bit_count"):
+    def _popcount(bits):
+        return bits.bit_count()
+else:
+    def _popcount(bits):
+        return bin(bits).count("1")
+
+
+class GeneVocabulary:
+
+    """Interns gene names: every gene name gets an integer ID, so that a
+    set of genes can be stored as a bitset (a Python <int>, where bit <i>
+    is set if gene <i> is in the set). All GeneSet objects made from the
+    same vocabulary share the gene names, that are stored only once.
+
+    The experimental conditions get a position too, in <conditions>: all
+    the TermRecord made from the same vocabulary share it, and keep their
+    scores in an array indexed by it.
+    """
+
+    def __init__(self, genes=()):
+        self.genes = []
+        self._ids = {}
+        self.conditions = {} # experimental condition: position
+        for gene in genes:
+            self.intern(gene)
+
+
+    def __len__(self):
+        return len(self.genes)
+
+
+    def intern(self, gene):
+        """Returns the ID of <gene>, adding it to the vocabulary if needed."""
+
+        ID = self._ids.get(gene)
+        if ID is None:
+            ID = len(self.genes)
+            self._ids[gene] = ID
+            self.genes.append(gene)
+        return ID
+
+
+    def get(self, gene, default=None):
+        return self._ids.get(gene, default)
+
+
+    def condition(self, name):
+        """Returns the position of condition <name>, adding it if needed."""
+
+        return self.conditions.setdefault(name, len(self.conditions))
+
+
+    def encode(self, genes):
+        """<list> of gene names -> <numpy.ndarray> of IDs."""
+
+        return np.array([self.intern(x) for x in genes], dtype=np.int64)
+
+
+    def ids(self, bits):
+        """Bitset -> sorted <numpy.ndarray> of the IDs it contains."""
+
+        if bits == 0:
+            return np.zeros(0, dtype=np.int64)
+        raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+        # only the bytes that are not 0 are unpacked, as in unpack()
+        where = np.flatnonzero(raw)
+        row, bit = np.nonzero(np.unpackbits(raw[where][:, None], axis=1, bitorder="little"))
+        return where[row] * 8 + bit
+
+
+    def decode(self, bits):
+        """Bitset -> <list> of gene names."""
+
+        return [self.genes[i] for i in self.ids(bits)]
+
+
+    def bits(self, genes):
+        """Iterable of gene names -> bitset."""
+
+        bits = 0
+        for gene in genes:
+            bits |= 1 << self.intern(gene)
+        return bits
+
+
+    def pack(self, groups, ids, n_groups, chunk=4096):
+        """Vectorized construction of many bitsets at once.
+
+        <groups> and <ids> are two <numpy.ndarray> of the same length: for
+        every <i>, gene <ids[i]> belongs to set number <groups[i]>.
+
+        Returns: <list> of <n_groups> bitsets.
+        """
+
+        out = [0] * n_groups
+        if len(ids) == 0:
+            return out
+
+        order = np.argsort(groups, kind="stable")
+        groups = groups[order]
+        ids = ids[order]
+        nbytes = int(ids.max()) // 8 + 1
+
+        # a (terms x bytes) matrix is filled one chunk of terms at a time,
+        # then every row is turned into a Python <int>
+        for start in range(0, n_groups, chunk):
+            stop = min(start + chunk, n_groups)
+            lo, hi = np.searchsorted(groups, [start, stop])
+            matrix = np.zeros((stop - start, nbytes), dtype=np.uint8)
+            np.bitwise_or.at(
+                matrix,
+                (groups[lo:hi] - start, ids[lo:hi] >> 3),
+                np.left_shift(1, ids[lo:hi] & 7).astype(np.uint8),
+            )
+            for i, row in enumerate(matrix):
+                out[start + i] = int.from_bytes(row.tobytes(), "little")
+
+        return out
+
+
+    def unpack(self, bitsets, chunk_bytes=1 << 22):
+        """The reverse of pack(): <list> of bitsets -> (groups, ids), sorted
+        by group and then by ID. Bitsets are turned into rows of a
+        (sets x 64-bit words) matrix, a chunk of them at a time.
+        """
+
+        bitsets = list(bitsets)
+        nwords = (max(bitsets, default=0).bit_length() + 63) // 64
+        if nwords == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        chunk = max(1, chunk_bytes // (nwords * 8))
+        groups, ids = [], []
+        for start in range(0, len(bitsets), chunk):
+            raw = b"".join(
+                bits.to_bytes(nwords * 8, "little") for bits in bitsets[start:start + chunk]
+            )
+            matrix = np.frombuffer(raw, dtype="<u8").reshape(-1, nwords)
+            # only the words, then the bytes of them, that are not 0 are
+            # unpacked: gene sets are sparse
+            rows, cols = np.nonzero(matrix != 0)
+            raw = matrix[rows, cols].view(np.uint8).reshape(-1, 8)
+            words, byte = np.nonzero(raw != 0)
+            bits, bit = np.nonzero(np.unpackbits(
+                raw[words, byte][:, None], axis=1, bitorder="little"
+            ))
+            words = words[bits]
+            groups.append(rows[words] + start)
+            ids.append((cols[words] * 8 + byte[bits]) * 8 + bit)
+
+        return (
+            np.concatenate(groups).astype(np.int64, copy=False),
+            np.concatenate(ids).astype(np.int64, copy=False),
+        )
+
+
+class GeneSet(Set):
+
+    """An immutable set of gene names, stored as a bitset over a
+    GeneVocabulary. It behaves like a Python <set> of <str> (iteration,
+    len(), 'in', comparisons, &, |, -, ^), and unions and intersections
+    with another GeneSet of the same vocabulary are single integer
+    operations. The IDs of its genes are decoded the first time it is
+    iterated, and kept for the next times.
+    """
+
+    __slots__ = ("bits", "vocabulary", "_ids")
+
+    def __init__(self, bits, vocabulary):
+        self.bits = bits
+        self.vocabulary = vocabulary
+        self._ids = None # decoded IDs, see _decoded()
+
+
+    @classmethod
+    def from_genes(cls, genes, vocabulary):
+        return cls(vocabulary.bits(genes), vocabulary)
+
+
+    def _from_iterable(self, iterable):
+        return GeneSet.from_genes(iterable, self.vocabulary)
+
+
+    def __contains__(self, gene):
+        ID = self.vocabulary.get(gene)
+        return ID is not None and (self.bits >> ID) & 1 == 1
+
+
+    def _decoded(self):
+        # sorted <numpy.ndarray> of the IDs of the genes
+        if self._ids is None:
+            self._ids = self.vocabulary.ids(self.bits)
+        return self._ids
+
+
+    def __iter__(self):
+        genes = self.vocabulary.genes
+        return iter([genes[i] for i in self._decoded().tolist()])
+
+
+    def __len__(self):
+        if self._ids is not None:
+            return len(self._ids)
+        return _popcount(self.bits)
+
+
+    def _same(self, other):
+        return isinstance(other, GeneSet) and other.vocabulary is self.vocabulary
+
+
+    def __and__(self, other):
+        if self._same(other):
+            return GeneSet(self.bits & other.bits, self.vocabulary)
+        return Set.__and__(self, other)
+
+
+    def __or__(self, other):
+        if self._same(other):
+            return GeneSet(self.bits | other.bits, self.vocabulary)
+        return Set.__or__(self, other)
+
+
+    def __sub__(self, other):
+        if self._same(other):
+            return GeneSet(self.bits & ~other.bits, self.vocabulary)
+        return Set.__sub__(self, other)
+
+
+    def __xor__(self, other):
+        if self._same(other):
+            return GeneSet(self.bits ^ other.bits, self.vocabulary)
+        return Set.__xor__(self, other)
+
+
+    def __eq__(self, other):
+        if self._same(other):
+            return self.bits == other.bits
+        return Set.__eq__(self, other)
+
+
+    __hash__ = Set._hash
+
+
+    def intersection(self, *others):
+        result = self
+        for other in others:
+            result = result & other
+        return result
+
+
+    def union(self, *others):
+        result = self
+        for other in others:
+            result = result | other
+        return result
+
+
+    def __repr__(self):
+        # same as a <set>, but sorted, so that it's always the same
+        if self.bits == 0:
+            return "set()"
+        return "{" + ", ".join(repr(x) for x in sorted(self)) + "}"
+
+
+# aggregated terms ===============================================================
+
+# keys of an aggregated term that are not experimental conditions
+_AGGREGATION_KEYS = ("highest score", "genes", "common")
+
+
+class TermRecord(MutableMapping):
+
+    """One aggregated term. The scores of the experimental conditions
+    are kept in a <numpy.ndarray> (NaN where the term was not found),
+    indexed by the {condition: position} <dict> that all the records of
+    an aggregation share (see GeneVocabulary.conditions); the rest is
+    kept in slots. This takes much less memory than a <dict> per term,
+    and a condition is found in constant time.
+
+    For older code, it also behaves like the <dict> it replaces:
+
+     keys                 values
+    "highest score"     - <float>
+    "genes"             - <set> of all genes
+    "exp condition"     - <float>
+    "exp condition2"    - <float>
+    ...
+    "common"            - <set> of the genes common to all conditions
+
+    positions  The shared {condition: position} <dict>. If None, the
+              record gets one of its own.
+    """
+
+    __slots__ = ("highest_score", "genes", "common", "positions", "values")
+
+    def __init__(self, highest_score=1, genes=(), common=None, conditions=(), scores=(),
+                 positions=None):
+        self.highest_score = highest_score
+        self.genes = genes
+        self.common = common # None when it is not there (yet)
+        self.positions = {} if positions is None else positions
+        self.values = np.full(len(self.positions), np.nan)
+        for condition, score in zip(conditions, scores):
+            self[condition] = score
+
+
+    @classmethod
+    def _from_row(cls, highest_score, genes, common, positions, values):
+        # <values>: a ready array of scores, indexed by <positions>
+        record = cls.__new__(cls)
+        record.highest_score = highest_score
+        record.genes = genes
+        record.common = common
+        record.positions = positions
+        record.values = values
+        return record
+
+
+    def _found(self):
+        # (conditions, scores) where the term was found. Positions are
+        # given in order, so the keys are in position order
+        found = np.flatnonzero(~np.isnan(self.values))
+        names = list(self.positions)
+        return [names[i] for i in found.tolist()], self.values[found].tolist()
+
+
+    @property
+    def conditions(self):
+        """<tuple> of the conditions the term was found in."""
+
+        return tuple(self._found()[0])
+
+
+    @property
+    def scores(self):
+        """<tuple> of the scores, in the same order as <conditions>."""
+
+        return tuple(self._found()[1])
+
+
+    def condition_scores(self):
+        """Returns a <dict> of experimental condition: score."""
+
+        return dict(zip(*self._found()))
+
+
+    def _position(self, key):
+        # position of condition <key>, if the term was found in it
+        i = self.positions.get(key)
+        if i is None or i >= len(self.values) or np.isnan(self.values[i]):
+            raise KeyError(key)
+        return i
+
+
+    def __getitem__(self, key):
+        if key == "highest score":
+            return self.highest_score
+        if key == "genes":
+            return self.genes
+        if key == "common":
+            if self.common is None:
+                raise KeyError(key)
+            return self.common
+        return self.values[self._position(key)].item()
+
+
+    def __setitem__(self, key, value):
+        if key == "highest score":
+            self.highest_score = value
+        elif key == "genes":
+            self.genes = value
+        elif key == "common":
+            self.common = value
+        else:
+            i = self.positions.setdefault(key, len(self.positions))
+            if i >= len(self.values):
+                # conditions were added since: make room for all of them
+                grown = np.full(len(self.positions), np.nan)
+                grown[:len(self.values)] = self.values
+                self.values = grown
+            self.values[i] = value
+
+
+    def __delitem__(self, key):
+        if key == "common" and self.common is not None:
+            self.common = None
+        elif key in ("highest score", "genes"):
+            raise KeyError(f"{key!r} can not be removed from a TermRecord")
+        else:
+            self.values[self._position(key)] = np.nan
+
+
+    def __iter__(self):
+        yield "highest score"
+        yield "genes"
+        yield from self.conditions
+        if self.common is not None:
+            yield "common"
+
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.values))) + (2 if self.common is None else 3)
+
+
+    def __repr__(self):
+        return f"TermRecord({dict(self)!r})"
+
+
+# ===============================================================
+
+def read_enrichment_table(file, ID, score, gene_names, engine=read_engine, sidecar=True):
+    """Reads a String enrichment table (*_enrichment.<kind>.tsv), loading
+    only the three columns that are needed: the terms (as index), their
+    score and the matching genes. The column names are the ones found in
+    settings.header_table. The protein ID columns, that are often the
+    largest ones, are never parsed.
+
+    Params:
+    =======
+
+    file:       <str> path to the .tsv file
+
+    ID, score, gene_names: <str> names of the term, score and genes columns
+
+    engine:     <str> pandas parser, "c" or "pyarrow" (needs the pyarrow
+                package). Defaults to settings.read_engine
+
+    sidecar:    <bool>; if True and the table has a binary copy (see
+                write_functional_enrichment_tables()) whose checksum
+                matches the .tsv file, the copy is loaded instead of
+                parsing the text
+
+    Returns: <pd.DataFrame> indexed by term, with a <float> score column
+    and a gene names column.
+    """
+
+    if sidecar:
+        df = _read_sidecar(file, ID, score, gene_names)
+        if df is not None:
+            return df
+
+    return pd.read_csv(
+        file,
+        sep=sep,
+        usecols=[ID, score, gene_names],
+        dtype={ID: object, score: "float64", gene_names: object},
+        index_col=ID,
+        engine=engine,
+    )
+
+
+def _read_enrichment_long(file, condition, ID, score, gene_names):
+    """Reads one String enrichment table and returns it in the "long" layout
+    used by the aggregation engine: one row per term, with columns
+    term, condition, direction, score and genes (the comma-separated
+    gene names).
+    """
+
+    df = read_enrichment_table(file, ID, score, gene_names)
+
+    return pd.DataFrame({
+        "term": df.index.to_numpy(),
+        "condition": condition,
+        "direction": os.path.basename(file)[:2], # "UP", "DO"(WN) or "AL"(L)
+        "score": df[score].to_numpy(dtype=float),
+        "genes": df[gene_names].to_numpy(),
+    })
+
+
+# per-directory cache of the partial aggregates: see _read_directory()
+CACHE_DIR = ".restring_cache"
+_CACHE_VERSION = 2
+
+
+def _cache_file(path, kind, way):
+    """Where the partial aggregate of <kind> and <way> of directory <path>
+    is cached.
+    """
+
+    return os.path.join(path, CACHE_DIR, f"{kind}.{'+'.join(way)}.npz")
+
+
+def _load_cached_partial(file, source):
+    """Returns the partial aggregate cached in <file> (as the <dict> of
+    arrays of PartialAggregate._arrays()), if it was made from the same
+    <source> files (see _read_directory()). A missing, outdated or
+    unreadable cache is just no cache: returns None.
+    """
+
+    try:
+        with np.load(file, allow_pickle=False) as data:
+            if str(data["source"]) != source or int(data["version"]) != _PARTIAL_VERSION:
+                return None
+            return {name: data[name] for name in data.files if name != "source"}
+    except Exception:
+        return None
+
+
+def _save_cached_partial(file, source, arrays):
+    """Atomically (over)writes the cache <file> with the <arrays> of a
+    partial aggregate.
+    """
+
+    tempname = f"{file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(tempname, "wb") as f:
+            np.savez(f, source=np.array(source), **arrays)
+        os.replace(tempname, file)
+    except OSError:
+        # a read-only folder just means no cache
+        if os.path.exists(tempname):
+            os.remove(tempname)
+
+
+def _encode_strings(strings):
+    """<list> of <str> -> (<numpy.ndarray> of UTF-8 bytes, offsets), so
+    that they can be stored in a .npz file without pickling.
+    """
+
+    strings = [str(x) for x in strings]
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in strings], out=offsets[1:])
+    return np.frombuffer("".join(strings).encode("utf-8"), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob, offsets):
+    """Inverse of _encode_strings(): returns a <list> of <str>."""
+
+    text = blob.tobytes().decode("utf-8")
+    offsets = offsets.tolist()
+    return list(map(text.__getitem__, map(slice, offsets[:-1], offsets[1:])))
+
+
+def _file_hash(path):
+    """Content hash of a file, read in chunks."""
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# binary copy of a String table, written next to it: see _write_sidecar()
+SIDECAR_SUFFIX = ".restring.npz"
+_SIDECAR_VERSION = 1
+
+
+def _write_sidecar(file, ID, score, gene_names):
+    """Writes the binary copy of the String table <file> (<file> +
+    SIDECAR_SUFFIX). It holds the checksum of <file> and the three columns
+    that read_enrichment_table() loads, as numpy arrays: the scores, and
+    the terms and genes as integer codes into one dictionary of strings.
+
+    The copy is made from the table as it is parsed from the text, so
+    that reading either one gives the same result.
+    """
+
+    df = read_enrichment_table(file, ID, score, gene_names, sidecar=False)
+    codes, strings = pd.factorize(
+        np.concatenate([df.index.to_numpy(dtype=object), df[gene_names].to_numpy(dtype=object)])
+    ) # missing values get code -1
+    strings, offsets = _encode_strings(strings)
+
+    outfile = file + SIDECAR_SUFFIX
+    tempfile = f"{outfile}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(
+            tempfile,
+            # version and size of the .tsv; its hash and the column names
+            meta=np.array([_SIDECAR_VERSION, os.path.getsize(file)], dtype=np.int64),
+            names=np.array([_file_hash(file), ID, score, gene_names]),
+            strings=strings,
+            offsets=offsets,
+            codes=codes, # terms first, then genes
+            score=df[score].to_numpy(dtype=np.float64),
+        )
+        os.replace(tempfile, outfile)
+    except OSError:
+        # no binary copy just means parsing the text
+        if os.path.exists(tempfile):
+            os.remove(tempfile)
+
+
+def _read_sidecar(file, ID, score, gene_names):
+    """Loads the binary copy of the String table <file>, as
+    read_enrichment_table() would return it. Returns None if there is no
+    copy, or if it does not match <file> any more.
+    """
+
+    sidecar = file + SIDECAR_SUFFIX
+    if not os.path.exists(sidecar):
+        return None
+
+    try:
+        with np.load(sidecar, allow_pickle=False) as data:
+            if (
+                data["meta"].tolist() != [_SIDECAR_VERSION, os.path.getsize(file)]
+                or data["names"].tolist() != [_file_hash(file), ID, score, gene_names]
+            ):
+                return None
+            strings = _decode_strings(data["strings"], data["offsets"])
+            codes, scores = data["codes"], data["score"]
+    except Exception:
+        return None
+
+    # missing values have code -1, that picks the trailing NaN
+    strings = np.array(strings + [np.nan], dtype=object)
+
+    index = pd.Index(strings[codes[:len(scores)]], name=ID, dtype=object)
+    return pd.DataFrame({
+        score: pd.Series(scores, index=index),
+        gene_names: pd.Series(strings[codes[len(scores):]], index=index, dtype=object),
+    })
+
+
+def _read_directory(path, condition, kinds, ways, header_table, cache=False, timed=False,
+                    keep_tables=False):
+    """Reads all String tables of <kinds> found in <path>, and aggregates
+    them for each of the <ways> (lists of directions, like ["UP", "DOWN"]).
+    <condition> is the experimental condition the tables belong to (the
+    directory name).
+
+    If <cache>, every partial aggregate is stored in <path>/CACHE_DIR as a
+    .npz file (see PartialAggregate.save()), together with the size and
+    modification time of the files it was made from. While these files do
+    not change, the aggregate is loaded instead of reading them again.
+
+    This runs in worker processes too, so it does not print anything, and
+    it sends back the partial aggregates rather than the tables, that are
+    much larger. They are sent as the arrays that save() writes, that take
+    less than the bitsets: see PartialAggregate._merge_arrays().
+
+    Returns: <dict> (way, kind): <dict> of the arrays of the
+    PartialAggregate (see PartialAggregate._arrays()); <dict> kind: long table
+    of the files read (None if there is none), only if <keep_tables>; a
+    <list> of (file, <bool> taken from the cache, seconds, rows, bytes read)
+    for every file used, whose last three are only measured if <timed> (and
+    None otherwise; files taken from the cache are 0 bytes); and the <list>
+    of the records of a Report of the aggregation and of the whole
+    directory ("read directory", wall time), if <timed>.
+    """
+
+    start_directory = perf_counter()
+    partials = {}
+    tables = {}
+    files_read = []
+    report = Report() if timed else _NO_REPORT
+    directions = set(x[:2] for way in ways for x in way)
+
+    for kind in kinds:
+        # ID : the column name of the wanted name (process, KEGG, ..)
+        # score: the column name or the wanted score (likely the false discovery rate or pval)
+        # gene_names: the column where the genes per term are stored
+
+        # picking the header handles form settings.header_table
+        # as of now, this is superfluous as all tables share the same layout. Should
+        # this change in the future, just update settings.header_table
+        ID, score, gene_names = header_table[kind].values()
+
+        # sorted, so that UP and DOWN files are always read in the same order
+        files = sorted(
+            os.path.basename(x) for x in
+            glob(os.path.join(escape(path), "*enrichment."+kind+".tsv"))
+        )
+        stats = {file: os.stat(os.path.join(path, file)) for file in files}
+
+        # the ways whose aggregate is not in the cache
+        missing = []
+        for way in ways:
+            wanted = [x[:2] for x in way]
+            used = [file for file in files if file[:2] in wanted]
+            partial = source = None
+            if cache and len(used) > 0:
+                source = json.dumps([
+                    _CACHE_VERSION, condition, [ID, score, gene_names],
+                    [[file, stats[file].st_size, stats[file].st_mtime_ns] for file in used],
+                ])
+                partial = _load_cached_partial(_cache_file(path, kind, way), source)
+            if partial is None:
+                missing.append((way, wanted, used, source))
+            partials[tuple(way), kind] = partial
+
+        to_read = set(file for _, _, used, _ in missing for file in used)
+        if keep_tables:
+            to_read.update(file for file in files if file[:2] in directions)
+
+        long = []
+        for file in files: # either UP and/or DOWN
+            if file[:2] not in directions:
+                continue
+
+            filepath = os.path.join(path, file)
+            if file not in to_read:
+                files_read.append((file, True, None, None, 0 if timed else None))
+                continue
+
+            if timed:
+                start = perf_counter()
+            table = _read_enrichment_long(filepath, condition, ID, score, gene_names)
+            long.append(table)
+            if timed:
+                files_read.append((
+                    file, False, perf_counter() - start, len(table.index), stats[file].st_size
+                ))
+            else:
+                files_read.append((file, False, None, None, None))
+
+        long = pd.concat(long, ignore_index=True) if len(long) > 0 else None
+        if keep_tables:
+            tables[kind] = long
+
+        for way, wanted, used, source in missing:
+            arrays = _aggregate_directory(
+                None if long is None else long[long["direction"].isin(wanted)],
+                kind, way, report
+            )
+            if source is not None:
+                _save_cached_partial(_cache_file(path, kind, way), source, arrays)
+            partials[tuple(way), kind] = arrays
+
+    if timed:
+        report.add(
+            "read directory", name=condition, seconds=perf_counter() - start_directory,
+            rows=sum(x[3] or 0 for x in files_read), nbytes=sum(x[4] for x in files_read),
+        )
+    return partials, tables, files_read, list(report.records)
+
+
+def _iter_directories(directories, kinds, ways, header_table, say,
+                      workers=None, PATH=PATH, cache=False, report=_NO_REPORT,
+                      keep_tables=False):
+    """Reads and aggregates the <directories> one after the other (see
+    _read_directory()), and yields (directory, {(way, kind): arrays of the
+    PartialAggregate}, {kind: long table}) in the order of <directories>.
+    A directory given more than once is only read the first time: the
+    result would be the same.
+
+    With <workers>, at most a few directories per worker are read ahead,
+    so that the aggregates waiting to be used stay few.
+
+    Every file and directory read is recorded in <report> (see Report).
+    """
+
+    directories = list(dict.fromkeys(directories))
+
+    PROCESSED_DIRS = 0
+    PROCESSED_FILES = 0
+    CACHED_FILES = 0
+
+    jobs = [
+        (os.path.join(os.path.abspath(PATH), d), d, kinds, ways, header_table, cache,
+         report.enabled, keep_tables)
+        for d in directories
+    ]
+
+    if workers is not None and workers > 1 and len(jobs) > 1:
+        say(f"Reading directories with {workers} worker processes.")
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+        def results():
+            pending = deque()
+            for job in jobs:
+                pending.append(executor.submit(_read_directory, *job))
+                if len(pending) >= workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        results = results()
+    else:
+        executor = None
+        results = (_read_directory(*job) for job in jobs)
+
+    try:
+        for d, (partials, tables, files_read, records) in zip(directories, results):
+            PROCESSED_DIRS += 1
+            say(
+                f"Processing directory: {d}", stage="read directory", name=d,
+                done=PROCESSED_DIRS, total=len(directories),
+            )
+            for file, from_cache, seconds, rows, nbytes in files_read:
+                PROCESSED_FILES += 1
+                if from_cache:
+                    CACHED_FILES += 1
+                    say(
+                        f"\tProcessing file {file} (unchanged, cached)", stage="read file",
+                        name=os.path.join(d, file), done=PROCESSED_FILES,
+                    )
+                else:
+                    say(
+                        f"\tProcessing file {file}", stage="read file",
+                        name=os.path.join(d, file), done=PROCESSED_FILES,
+                    )
+                report.add(
+                    "read file", name=os.path.join(d, file), seconds=seconds,
+                    rows=rows, nbytes=nbytes, cached=from_cache
+                )
+
+            # the aggregation and "read directory" (wall time) records
+            report.extend(records)
+
+            yield d, partials, tables
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if cache:
+        say(f"{CACHED_FILES} of {PROCESSED_FILES} files were unchanged, and taken from the cache.")
+
+    say(
+        f"\nProcessed {PROCESSED_DIRS} directories and {PROCESSED_FILES} files.",
+        stage="read directory", done=PROCESSED_DIRS, total=len(directories),
+    )
+
+
+def _walk_directories(directories, kinds, ways, header_table, say,
+                      workers=None, PATH=PATH, cache=False, report=_NO_REPORT,
+                      gene_index=None):
+    """Walks the <directories> once, reading every String table of all the
+    given <kinds> and <ways>. Each file is read exactly once, and each
+    directory is aggregated on its own (see _read_directory()); then the
+    partial aggregates of all directories are merged, for every way and
+    kind. Relative <directories> are looked for in <PATH>.
+
+    If <workers> is more than 1, directories are read and aggregated in a
+    pool of <workers> processes. Results are merged in the order of
+    <directories>, so the output is the same as reading them one by one.
+
+    <cache> is passed over to _read_directory().
+
+    The tables read are added to <gene_index>, if given (see GeneIndex):
+    only then are the tables sent back by the workers too.
+
+    Returns: <dict> (way, kind): PartialAggregate.
+    """
+
+    partials = {(tuple(way), kind): [] for way in ways for kind in kinds}
+    tables = {kind: [] for kind in kinds}
+    for d, dir_partials, dir_tables in _iter_directories(
+        directories, kinds, ways, header_table, say, workers, PATH, cache, report,
+        keep_tables=gene_index is not None
+    ):
+        for key, partial in dir_partials.items():
+            partials[key].append(partial)
+        for kind, long in dir_tables.items():
+            if long is not None:
+                tables[kind].append(long)
+
+    if gene_index is not None:
+        for kind in kinds:
+            if len(tables[kind]) > 0:
+                gene_index.add(pd.concat(tables[kind], ignore_index=True), kind)
+
+    aggregated = {}
+    for (way, kind), parts in partials.items():
+        name = f"{'+'.join(way)} {kind}"
+        with report.stage("aggregation", name=name, rows=sum(len(x) for x in parts)):
+            aggregated[way, kind] = PartialAggregate._merge_arrays(parts, kind, way)
+
+    return aggregated
+
+
+def _explode_genes(long, vocabulary):
+    """Splits the comma-joined genes of the long table <long>.
+
+    Returns: (row, gene ID) <numpy.ndarray> pairs, one per gene of every
+    row, with the IDs of <vocabulary>.
+    """
+
+    # plain <str> methods: much faster than the .str accessor, on the small
+    # tables of a single directory
+    genes_per_row = [
+        x.split(",") if isinstance(x, str) else []
+        for x in long["genes"].to_numpy(dtype=object)
+    ]
+    row = np.repeat(
+        np.arange(len(long.index)),
+        np.fromiter(map(len, genes_per_row), dtype=np.int64, count=len(genes_per_row))
+    )
+    gene_ids, gene_names = pd.factorize(
+        pd.Series([x for x in genes_per_row for x in x], dtype=object)
+    )
+    return row, vocabulary.encode(gene_names)[gene_ids]
+
+
+def _partial_aggregate(long, vocabulary, report=_NO_REPORT, name=None):
+    """Aggregates the long table of the files read, up to the point where
+    more tables could still be merged in (see _StreamingAggregate).
+
+    Rows must be in reading order: for a term found in more than one file
+    of the same directory (UP and DOWN), the score of the last file read
+    is kept, and the genes of the first file read are used to find the
+    genes that are common to all conditions. This is what happened when
+    the files were processed one row at a time.
+
+    Gene names are interned into <vocabulary>, and all gene set
+    operations are done on integer IDs.
+
+    The time spent finding the common genes is recorded in <report>, as
+    <name>.
+
+    Returns: <dict> with, for every term (in order of appearance):
+    "terms" (names), "best" (lowest score, NaN if there is none),
+    "conditions" (number of conditions it was found in); "genes" and
+    "common", as (term, gene ID) <numpy.ndarray> pairs, sorted; and one
+    row per term and condition: "score_terms", "score_conditions" (codes
+    into "condition_names") and "scores".
+    """
+
+    term_codes, terms = pd.factorize(long["term"])
+    condition_codes, conditions = pd.factorize(long["condition"])
+    n_terms = len(terms)
+
+    # lowest score of every term, NaN if it has none
+    score = long["score"].to_numpy(dtype=np.float64)
+    best = np.full(n_terms, np.inf)
+    np.fmin.at(best, term_codes, score)
+    best[np.bincount(term_codes, weights=~np.isnan(score), minlength=n_terms) == 0] = np.nan
+
+    # one row per gene and term
+    row, gene_ids = _explode_genes(long, vocabulary)
+
+    # union of all genes, for every term
+    n_genes = max(len(vocabulary), 1)
+    genes = np.divmod(np.unique(term_codes[row].astype(np.int64) * n_genes + gene_ids), n_genes)
+
+    # a gene is common when it is found in all conditions where the term
+    # was found. The genes of the first file of each directory are used
+    start = perf_counter()
+    pair = term_codes.astype(np.int64) * (condition_codes.max() + 1) + condition_codes
+    first_rows = np.zeros(len(long.index), dtype=bool)
+    first_rows[np.unique(pair, return_index=True)[1]] = True
+    conditions_per_term = np.bincount(
+        term_codes[first_rows], minlength=n_terms
+    )
+
+    # (term, condition, gene) and (term, gene) are packed into single
+    # int64 keys, which are much faster to np.unique() than rows
+    keep = first_rows[row]
+    triple = np.unique(pair[row][keep] * n_genes + gene_ids[keep])
+    term_gene, conditions_per_gene = np.unique(
+        triple // n_genes // (condition_codes.max() + 1) * n_genes + triple % n_genes,
+        return_counts=True
+    )
+    term_of, gene_of = np.divmod(term_gene, n_genes)
+    is_common = conditions_per_gene == conditions_per_term[term_of]
+    common = term_of[is_common], gene_of[is_common]
+    report.add("common genes", name=name, seconds=perf_counter() - start, rows=len(keep))
+
+    # rows holding the score of each term in each condition: the last ones
+    scores = np.sort(len(pair) - 1 - np.unique(pair[::-1], return_index=True)[1])
+
+    return {
+        "terms": list(terms),
+        "best": best,
+        "genes": genes,
+        "common": common,
+        "conditions": conditions_per_term,
+        "score_terms": term_codes[scores],
+        "score_conditions": condition_codes[scores],
+        "condition_names": list(conditions), # one <str> object per condition
+        "scores": score[scores],
+    }
+
+
+def _aggregate_directory(long, kind, way, report=_NO_REPORT):
+    """Aggregates the long table of the files of a single directory, for
+    <kind> and <way>, straight into the arrays of a PartialAggregate (see
+    _partial_arrays()): the gene sets are never turned into bitsets here,
+    only once all directories are merged (see
+    PartialAggregate._merge_arrays()).
+    """
+
+    if long is None or len(long.index) == 0:
+        return PartialAggregate(kind, way)._arrays()
+
+    vocabulary = GeneVocabulary()
+    name = f"{'+'.join(way)} {kind}"
+    with report.stage("aggregation", name=name, rows=len(long.index)):
+        part = _partial_aggregate(long, vocabulary, report, name)
+
+    scores = np.empty(len(part["scores"]), dtype=_SCORES_DTYPE)
+    scores["term"] = part["score_terms"]
+    scores["condition"] = part["score_conditions"]
+    scores["score"] = part["scores"]
+
+    return _partial_arrays(
+        kind, way, part["terms"], vocabulary.genes, part["condition_names"],
+        part["best"], part["conditions"], part["genes"], part["common"], scores,
+    )
+
+
+def _select_terms(best, top_k=None, max_fdr=None):
+    """Returns a <bool> mask of the terms to keep: the ones whose <best>
+    score is at most <max_fdr>, and of these, the <top_k> with the lowest
+    score (ties go to the terms found first). The <top_k> are found with
+    a partial sort, without sorting all the scores.
+    """
+
+    selected = np.ones(len(best), dtype=bool)
+    if max_fdr is not None:
+        selected &= best <= max_fdr
+
+    if top_k is not None and selected.sum() > top_k:
+        candidates = np.flatnonzero(selected)
+        selected[:] = False
+        if top_k > 0:
+            scores = best[candidates]
+            threshold = np.partition(scores, top_k - 1)[top_k - 1]
+            below = candidates[scores < threshold]
+            ties = candidates[scores == threshold][:top_k - len(below)]
+            selected[below] = True
+            selected[ties] = True
+
+    return selected
+
+
+def _term_records(terms, best, genes, common, conditions_per_term,
+                  score_chunks, condition_names, vocabulary,
+                  top_k=None, max_fdr=None):
+    """Builds the <bestof> dict of TermRecord, out of the per-term arrays
+    of _partial_aggregate(). <score_chunks> is a function that returns an
+    iterable of (term codes, condition codes, scores) arrays, in reading
+    order. It is called twice, and the scores are only ever held one
+    chunk at a time: first to find the order of the terms, then to fill
+    their rows. The (terms x conditions) matrix of the scores is what the
+    records are made of.
+
+    With <top_k> and/or <max_fdr>, only the records of the terms picked
+    by _select_terms() are built.
+    """
+
+    best = np.asarray(best, dtype=float)
+    best = np.where(np.isnan(best), 1, np.minimum(best, 1)) # scores start from 1, as p-values do
+
+    selected = None
+    if top_k is not None or max_fdr is not None:
+        selected = _select_terms(best, top_k, max_fdr)
+
+    def chunks():
+        for chunk_terms, chunk_conditions, chunk_scores in score_chunks():
+            chunk_terms = np.asarray(chunk_terms, dtype=np.int64)
+            if selected is not None:
+                keep = selected[chunk_terms]
+                chunk_terms = chunk_terms[keep]
+                chunk_conditions = chunk_conditions[keep]
+                chunk_scores = chunk_scores[keep]
+            yield chunk_terms, np.asarray(chunk_conditions, dtype=np.int64), chunk_scores
+
+    # one row of scores per term, in order of their first score, and one
+    # column per condition (see GeneVocabulary.conditions)
+    seen = np.zeros(len(terms), dtype=bool)
+    order = []
+    for chunk_terms, _, _ in chunks():
+        first = np.sort(np.unique(chunk_terms, return_index=True)[1])
+        new = chunk_terms[first]
+        new = new[~seen[new]]
+        seen[new] = True
+        order.append(new)
+    order = np.concatenate(order) if len(order) > 0 else np.zeros(0, dtype=np.int64)
+    if len(order) == 0:
+        return {}
+
+    column = np.array(
+        [vocabulary.condition(name) for name in condition_names], dtype=np.int64
+    )
+    positions = vocabulary.conditions
+
+    row = np.empty(len(terms), dtype=np.int64)
+    row[order] = np.arange(len(order))
+    matrix = np.full((len(order), len(positions)), np.nan)
+    for chunk_terms, chunk_conditions, chunk_scores in chunks():
+        matrix[row[chunk_terms], column[chunk_conditions]] = chunk_scores
+
+    bestof = {}
+    for r, i in enumerate(order.tolist()):
+        bestof[terms[i]] = TermRecord._from_row(
+            best[i].item(),
+            GeneSet(genes[i], vocabulary),
+            _common_genes(conditions_per_term[i], common[i], vocabulary),
+            positions,
+            matrix[r],
+        )
+
+    return bestof
+
+
+def _ranks(strings):
+    """Position of every <str> in sorted(<strings>)."""
+
+    # a fixed width unicode array is sorted much faster than <str> objects,
+    # in the same (code point) order
+    order = np.argsort(np.array(strings, dtype=str), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def _sorted_names(bitsets, vocabulary, rank=None):
+    """<list> of bitsets of <vocabulary> -> <list> of the sorted gene names
+    of each. All the bitsets are decoded at once (see
+    GeneVocabulary.unpack()), and the genes are put in alphabetical order
+    through their <rank> (see _ranks()).
+    """
+
+    if rank is None:
+        rank = _ranks(vocabulary.genes)
+    groups, ids = vocabulary.unpack(bitsets)
+    names = np.array(vocabulary.genes, dtype=object)
+    names = names[ids[np.argsort(groups * len(rank) + rank[ids], kind="stable")]]
+    bounds = np.zeros(len(bitsets) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=len(bitsets)), out=bounds[1:])
+    return [names[bounds[n]:bounds[n + 1]].tolist() for n in range(len(bitsets))]
+
+
+def _sorted_gene_sets(sets):
+    """<list> of gene sets -> <list> of the sorted gene names of each. The
+    GeneSet objects that share the vocabulary of the first one are
+    decoded all at once (see _sorted_names()), the other sets one by one.
+    """
+
+    vocabulary = next((x.vocabulary for x in sets if isinstance(x, GeneSet)), None)
+    if vocabulary is None:
+        return [sorted(x) for x in sets]
+
+    shared = [
+        i for i, x in enumerate(sets)
+        if isinstance(x, GeneSet) and x.vocabulary is vocabulary
+    ]
+    out = [None] * len(sets)
+    for i, names in zip(shared, _sorted_names([sets[i].bits for i in shared], vocabulary)):
+        out[i] = names
+    for i, x in enumerate(sets):
+        if out[i] is None:
+            out[i] = sorted(x)
+    return out
+
+
+def _common_genes(conditions, common, vocabulary):
+    """The "common" genes of a term found in <conditions> conditions,
+    whose <common> bitset is the intersection of the genes of each.
+    """
+
+    if conditions == 1:
+        return set(list(["n/a (just one condition)"]))
+    if common == 0:
+        return set(list(["No common gene"]))
+    return GeneSet(common, vocabulary)
+
+
+_SCORES_DTYPE = np.dtype([("term", np.int64), ("condition", np.int64), ("score", np.float64)])
+_PARTIAL_VERSION = 1
+
+
+def _partial_arrays(kind, way, terms, gene_names, condition_names, best, conditions,
+                    genes, common, scores):
+    """The arrays a PartialAggregate is saved as (see PartialAggregate.save()),
+    that hold no Python objects: strings are UTF-8 bytes with offsets (see
+    _encode_strings()), and the "genes" and "common" gene sets are the IDs
+    in each, given as sorted (term, gene ID) pairs.
+    """
+
+    arrays = {}
+    for name, strings in (
+        ("terms", terms),
+        ("gene_names", gene_names),
+        ("condition_names", condition_names),
+        ("header", ["" if kind is None else kind] + list(way or ())),
+    ):
+        arrays[name], arrays[name + "_offsets"] = _encode_strings(strings)
+
+    for name, (groups, ids) in (("genes", genes), ("common", common)):
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(groups, minlength=len(terms)), out=offsets[1:])
+        arrays[name] = np.asarray(ids, dtype=np.int64)
+        arrays[name + "_offsets"] = offsets
+
+    return dict(
+        version=np.int64(_PARTIAL_VERSION),
+        has_way=np.bool_(way is not None),
+        best=np.array(best, dtype=np.float64),
+        conditions=np.array(conditions, dtype=np.int64),
+        scores=scores,
+        **arrays,
+    )
+
+
+class PartialAggregate:
+
+    """Aggregation of one kind and way that can still be merged with
+    others: aggregate different directories (for example, on different
+    machines), save() the partial aggregates, then load() and merge()
+    them, and finally get the same results as aggregating all the
+    directories at once with records().
+
+    For every term, it keeps the lowest score, the union of the genes,
+    the running intersection of the genes of each condition and the
+    number of conditions; and the score of every term in every condition.
+
+    merge() is associative: a.merge(b).merge(c) is the same as
+    a.merge(b.merge(c)). A same directory (experimental condition) must
+    not be in two merged aggregates.
+    """
+
+    def __init__(self, kind=None, way=None, vocabulary=None):
+        self.kind = kind
+        self.way = None if way is None else tuple(way)
+        self.vocabulary = GeneVocabulary() if vocabulary is None else vocabulary
+
+        self.terms = []
+        self.term_index = {} # term: position in the lists below
+        self.best = []
+        self.genes = []
+        self.common = []
+        self.conditions = []
+
+        self.condition_names = []
+        self.condition_index = {}
+
+        self._scores = [] # chunks of _SCORES_DTYPE records
+
+
+    def __len__(self):
+        return len(self.terms)
+
+
+    def __repr__(self):
+        return (
+            f"PartialAggregate(kind={self.kind!r}, way={self.way!r}, "
+            f"terms={len(self.terms)}, conditions={len(self.condition_names)})"
+        )
+
+
+    def add(self, long, report=None):
+        """Merges in the long table of a batch of directories (see
+        _read_enrichment_long()). Directories must not be added twice.
+        The time it takes is recorded in <report> (see Report).
+        """
+
+        if long is None or len(long.index) == 0:
+            return
+
+        report = _NO_REPORT if report is None else report
+        with report.stage("aggregation", name=self._label(), rows=len(long.index)):
+            self._add(long, report)
+
+
+    def _label(self):
+        way = "" if self.way is None else "+".join(self.way) + " "
+        return f"{way}{self.kind or ''}".strip() or None
+
+
+    def _add(self, long, report):
+        part = _partial_aggregate(long, self.vocabulary, report, self._label())
+
+        shared = set(part["condition_names"]).intersection(self.condition_index)
+        if len(shared) > 0:
+            raise ValueError(f"Conditions already aggregated: {sorted(shared)}")
+
+        n_terms = len(part["terms"])
+        term_codes = self._merge_terms(
+            part["terms"], part["best"],
+            self.vocabulary.pack(*part["genes"], n_terms),
+            self.vocabulary.pack(*part["common"], n_terms),
+            part["conditions"]
+        )
+        condition_codes = self._merge_conditions(part["condition_names"])
+
+        chunk = np.empty(len(part["scores"]), dtype=_SCORES_DTYPE)
+        chunk["term"] = term_codes[part["score_terms"]]
+        chunk["condition"] = condition_codes[part["score_conditions"]]
+        chunk["score"] = part["scores"]
+        self._keep_scores(chunk)
+
+
+    def _merge_terms(self, terms, best, genes, common, conditions):
+        """Merges per-term values, whose gene bitsets are already over
+        self.vocabulary. Returns the positions of <terms> in self.terms.
+        """
+
+        if len(self.terms) == 0:
+            # nothing to merge with
+            self.terms = list(terms)
+            self.term_index = {term: i for i, term in enumerate(self.terms)}
+            self.best = list(best)
+            self.genes = list(genes)
+            self.common = list(common)
+            self.conditions = [int(x) for x in conditions]
+            return np.arange(len(terms), dtype=np.int64)
+
+        codes = np.empty(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            j = self.term_index.get(term)
+            if j is None:
+                j = self.term_index[term] = len(self.terms)
+                self.terms.append(term)
+                self.best.append(best[i])
+                self.genes.append(genes[i])
+                self.common.append(common[i])
+                self.conditions.append(int(conditions[i]))
+            else:
+                self.best[j] = np.fmin(self.best[j], best[i])
+                self.genes[j] |= genes[i]
+                self.common[j] &= common[i]
+                self.conditions[j] += int(conditions[i])
+            codes[i] = j
+        return codes
+
+
+    def _merge_conditions(self, names):
+        codes = np.array([
+            self.condition_index.setdefault(x, len(self.condition_index))
+            for x in names
+        ], dtype=np.int64)
+        self.condition_names = list(self.condition_index)
+        return codes
+
+
+    def _keep_scores(self, chunk):
+        self._scores.append(chunk)
+
+
+    def _score_chunks(self):
+        """Yields (term codes, condition codes, scores), in reading order."""
+
+        for chunk in self._scores:
+            yield chunk["term"], chunk["condition"], chunk["score"]
+
+
+    def _score_array(self):
+        """All the scores, as one array of _SCORES_DTYPE records. Do not
+        change it: it can be the array the scores are kept in.
+        """
+
+        if len(self._scores) == 0:
+            return np.zeros(0, dtype=_SCORES_DTYPE)
+        if len(self._scores) == 1:
+            return self._scores[0]
+        return np.concatenate(self._scores)
+
+
+    def merge(self, other):
+        """Returns a new PartialAggregate, with the directories of both
+        <self> and <other>. Neither of them is changed.
+        """
+
+        for attr in ("kind", "way"):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            if mine is not None and theirs is not None and mine != theirs:
+                raise ValueError(f"Can not merge aggregates of different {attr}: {mine} and {theirs}")
+
+        merged = PartialAggregate(
+            self.kind if self.kind is not None else other.kind,
+            self.way if self.way is not None else other.way,
+            GeneVocabulary(self.vocabulary.genes),
+        )
+        merged._merge_terms(self.terms, self.best, self.genes, self.common, self.conditions)
+        merged._merge_conditions(self.condition_names)
+        merged._scores = [self._score_array()]
+        merged._absorb(other)
+
+        return merged
+
+
+    def _absorb(self, other):
+        """Merges <other> into <self>, in place."""
+
+        shared = set(self.condition_index).intersection(other.condition_index)
+        if len(shared) > 0:
+            raise ValueError(f"Conditions found in both aggregates: {sorted(shared)}")
+
+        # the genes of <other> are added to the vocabulary, and its
+        # bitsets are translated to the new gene IDs
+        gene_map = (
+            None if other.vocabulary is self.vocabulary
+            else self.vocabulary.encode(other.vocabulary.genes)
+        )
+        if gene_map is None or np.array_equal(gene_map, np.arange(len(gene_map))):
+            genes, common = other.genes, other.common
+        else:
+            genes = other._remap_from(other.genes, self.vocabulary, gene_map)
+            common = other._remap_from(other.common, self.vocabulary, gene_map)
+
+        term_codes = self._merge_terms(other.terms, other.best, genes, common, other.conditions)
+        condition_codes = self._merge_conditions(other.condition_names)
+        for chunk in other._score_chunks():
+            new = np.empty(len(chunk[0]), dtype=_SCORES_DTYPE)
+            new["term"] = term_codes[chunk[0]]
+            new["condition"] = condition_codes[chunk[1]]
+            new["score"] = chunk[2]
+            self._keep_scores(new)
+
+
+    @classmethod
+    def _merge_arrays(cls, parts, kind=None, way=None, vocabulary=None):
+        """Same as loading the partial aggregates saved as <parts> (the
+        <dict> of arrays of _arrays() of each) and merging them one after
+        the other with merge(), but in a few vectorized steps, and without
+        building the bitsets of each: this is how the aggregates of single
+        directories are put together. Gene names are interned into
+        <vocabulary>, if given.
+        """
+
+        merged = cls(kind, way, vocabulary)
+
+        terms, gene_maps, condition_codes = [], [], []
+        for data in parts:
+            names = _decode_strings(data["condition_names"], data["condition_names_offsets"])
+            shared = set(merged.condition_index).intersection(names)
+            if len(shared) > 0:
+                raise ValueError(f"Conditions found in more than one aggregate: {sorted(shared)}")
+            condition_codes.append(merged._merge_conditions(names))
+            terms.append(_decode_strings(data["terms"], data["terms_offsets"]))
+            gene_maps.append(merged.vocabulary.encode(
+                _decode_strings(data["gene_names"], data["gene_names_offsets"])
+            ))
+
+        if sum(len(x) for x in terms) == 0:
+            return merged
+
+        # one row per term of every partial aggregate
+        term_codes, unique_terms = pd.factorize(
+            pd.Series([term for x in terms for term in x], dtype=object)
+        )
+        starts = np.cumsum([0] + [len(x) for x in terms])
+        n_terms = len(unique_terms)
+
+        best = pd.Series(
+            np.concatenate([data["best"] for data in parts])
+        ).groupby(term_codes).min().to_numpy()
+        conditions = np.bincount(
+            term_codes,
+            weights=np.concatenate([data["conditions"] for data in parts]),
+            minlength=n_terms,
+        ).astype(np.int64)
+
+        # (term, gene ID) pairs of the genes and of the common genes, with
+        # the IDs of the merged vocabulary
+        pairs = {}
+        for name in ("genes", "common"):
+            groups = [
+                np.repeat(term_codes[start:start + len(x)], np.diff(data[name + "_offsets"]))
+                for data, start, x in zip(parts, starts, terms)
+            ]
+            ids = [gene_map[data[name]] for data, gene_map in zip(parts, gene_maps)]
+            pairs[name] = np.concatenate(groups), np.concatenate(ids)
+
+        genes = merged.vocabulary.pack(*pairs["genes"], n_terms)
+
+        # a gene is common when it is common in every partial aggregate
+        # the term was found in
+        n_genes = max(len(merged.vocabulary), 1)
+        term_gene, found_in = np.unique(
+            pairs["common"][0] * n_genes + pairs["common"][1], return_counts=True
+        )
+        term_of, gene_of = np.divmod(term_gene, n_genes)
+        is_common = found_in == np.bincount(term_codes, minlength=n_terms)[term_of]
+        common = merged.vocabulary.pack(term_of[is_common], gene_of[is_common], n_terms)
+
+        merged._merge_terms(list(unique_terms), best, genes, common, conditions)
+
+        scores = []
+        for data, start, codes in zip(parts, starts, condition_codes):
+            chunk = np.empty(len(data["scores"]), dtype=_SCORES_DTYPE)
+            chunk["term"] = term_codes[start + data["scores"]["term"]]
+            chunk["condition"] = codes[data["scores"]["condition"]]
+            chunk["score"] = data["scores"]["score"]
+            scores.append(chunk)
+        merged._scores = [np.concatenate(scores)]
+
+        return merged
+
+
+    def _remap_from(self, bitsets, vocabulary, gene_map):
+        """Translates <bitsets> of self.vocabulary into <vocabulary>."""
+
+        ids = [self.vocabulary.ids(bits) for bits in bitsets]
+        groups = np.repeat(np.arange(len(ids)), [len(x) for x in ids])
+        ids = np.concatenate(ids) if len(ids) > 0 else np.zeros(0, dtype=np.int64)
+        return vocabulary.pack(groups, gene_map[ids], len(bitsets))
+
+
+    def records(self, top_k=None, max_fdr=None, report=None):
+        """Returns the <bestof> dict of TermRecord, as aggregate_results()
+        does. <top_k> and <max_fdr> only keep the best terms (see
+        aggregate_results()). The time it takes is recorded in <report>.
+        """
+
+        if len(self.terms) == 0:
+            return {}
+
+        report = _NO_REPORT if report is None else report
+        with report.stage("records", name=self._label()) as record:
+            bestof = _term_records(
+                self.terms, self.best, self.genes, self.common, self.conditions,
+                self._score_chunks, self.condition_names, self.vocabulary,
+                top_k, max_fdr,
+            )
+            record["rows"] = len(bestof)
+
+        return bestof
+
+
+    def result(self, top_k=None, max_fdr=None):
+        """Returns an AggregationResult, that builds the records and the
+        tables only when asked for.
+        """
+
+        return AggregationResult(self, top_k, max_fdr)
+
+
+    def save(self, file):
+        """Writes the partial aggregate to <file> (a .npz file)."""
+
+        np.savez(file, **self._arrays())
+
+
+    def _arrays(self):
+        """The arrays save() writes, as a <dict>."""
+
+        return _partial_arrays(
+            self.kind, self.way, self.terms, self.vocabulary.genes, self.condition_names,
+            self.best, self.conditions, self.vocabulary.unpack(self.genes),
+            self.vocabulary.unpack(self.common), self._score_array(),
+        )
+
+
+    @classmethod
+    def load(cls, file):
+        """Reads a partial aggregate written by save()."""
+
+        with np.load(file, allow_pickle=False) as data:
+            return cls._from_arrays(data, file)
+
+
+    @classmethod
+    def _from_arrays(cls, data, file=None):
+        """The reverse of _arrays(): <data> is what np.load() returns."""
+
+        if int(data["version"]) != _PARTIAL_VERSION:
+            raise ValueError(f"{file}: unsupported partial aggregate version {int(data['version'])}")
+
+        header = _decode_strings(data["header"], data["header_offsets"])
+        partial = cls(
+            header[0] if header[0] != "" else None,
+            header[1:] if bool(data["has_way"]) else None,
+            GeneVocabulary(_decode_strings(data["gene_names"], data["gene_names_offsets"])),
+        )
+
+        terms = _decode_strings(data["terms"], data["terms_offsets"])
+        bitsets = {}
+        for name in ("genes", "common"):
+            offsets = data[name + "_offsets"]
+            groups = np.repeat(np.arange(len(terms)), np.diff(offsets))
+            bitsets[name] = partial.vocabulary.pack(groups, data[name], len(terms))
+
+        partial._merge_terms(
+            terms, data["best"], bitsets["genes"], bitsets["common"], data["conditions"]
+        )
+        partial._merge_conditions(
+            _decode_strings(data["condition_names"], data["condition_names_offsets"])
+        )
+        partial._scores = [data["scores"]]
+
+        return partial
+
+
+class _StreamingAggregate(PartialAggregate):
+
+    """PartialAggregate whose tables are added a batch of directories at
+    a time, so that they never need to be all in memory at once. The score
+    of every term in every condition is spilled to <spill_file> on disk
+    after each batch, and read back through a numpy memmap in chunks.
+    """
+
+    def __init__(self, spill_file, kind=None, way=None, vocabulary=None):
+        super().__init__(kind, way, vocabulary)
+        self.spill_file = spill_file
+        self.n_scores = 0
+
+
+    def _keep_scores(self, chunk):
+        with open(self.spill_file, "ab") as f:
+            chunk.tofile(f)
+        self.n_scores += len(chunk)
+
+
+    def _score_chunks(self, chunk_size=1 << 20):
+        if self.n_scores == 0:
+            return
+
+        spilled = np.memmap(self.spill_file, dtype=_SCORES_DTYPE, mode="r", shape=(self.n_scores,))
+        try:
+            for i in range(0, self.n_scores, chunk_size):
+                chunk = np.asarray(spilled[i:i + chunk_size])
+                yield chunk["term"], chunk["condition"], chunk["score"]
+        finally:
+            del spilled
+
+
+    def _score_array(self):
+        # read from the spill file straight into one array
+        if self.n_scores == 0:
+            return np.zeros(0, dtype=_SCORES_DTYPE)
+        return np.fromfile(self.spill_file, dtype=_SCORES_DTYPE, count=self.n_scores)
+
+
+    def detach(self):
+        """Returns a PartialAggregate holding the scores in memory, that
+        does not need the spill file any more.
+        """
+
+        partial = PartialAggregate(self.kind, self.way, self.vocabulary)
+        partial._merge_terms(self.terms, self.best, self.genes, self.common, self.conditions)
+        partial._merge_conditions(self.condition_names)
+        partial._scores = [self._score_array()]
+        return partial
+
+
+class AggregationResult:
+
+    """What aggregate_results() and aggregate_all() return with lazy=True.
+
+    It holds the aggregation as arrays (see PartialAggregate), and only
+    builds what is asked for, once:
+
+    result.results()     the table of tableize_aggregated()
+    result.summary()     the table of summary()
+    result.records()     the <bestof> dict of TermRecord
+    result.genes(term)   all the genes of a term
+    result.common(term)  the genes of a term common to all conditions
+
+    Both tables are built straight from the arrays, sharing the terms,
+    scores and gene sets they need, instead of walking the <bestof> dict
+    twice. Tables are memoized: the same DataFrame is returned on every
+    call, so copy() it before changing it. tableize_aggregated() and
+    summary() accept an AggregationResult too, and return copies.
+    """
+
+    def __init__(self, aggregate, top_k=None, max_fdr=None):
+        self.aggregate = aggregate
+        self.kind = aggregate.kind
+        self.way = aggregate.way
+        self.top_k = top_k
+        self.max_fdr = max_fdr
+        self._memo = {}
+
+
+    def __len__(self):
+        return len(self._core()["terms"])
+
+
+    def __iter__(self):
+        return iter(self._core()["terms"])
+
+
+    def __contains__(self, term):
+        return term in self._core()["rows"]
+
+
+    def __repr__(self):
+        return (
+            f"AggregationResult(kind={self.kind!r}, way={self.way!r}, "
+            f"terms={len(self)})"
+        )
+
+
+    def _memoized(self, key, build):
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+
+    def _core(self):
+        """The selected terms (sorted), their best scores, and the score of
+        each term in each condition as (row, condition code, score).
+        """
+
+        return self._memoized("core", self._build_core)
+
+
+    def _build_core(self):
+        aggregate = self.aggregate
+        best = np.asarray(aggregate.best, dtype=float)
+        best = np.where(np.isnan(best), 1, np.minimum(best, 1))
+
+        positions = np.arange(len(aggregate.terms))
+        if self.top_k is not None or self.max_fdr is not None:
+            positions = np.flatnonzero(_select_terms(best, self.top_k, self.max_fdr))
+        positions = sorted(positions.tolist(), key=aggregate.terms.__getitem__)
+
+        row_of = np.full(len(aggregate.terms), -1, dtype=np.int64)
+        row_of[positions] = np.arange(len(positions))
+
+        # every term has one score per condition (see _partial_aggregate())
+        scores = aggregate._score_array()
+        if len(positions) < len(aggregate.terms):
+            scores = scores[row_of[scores["term"]] >= 0]
+
+        terms = [aggregate.terms[i] for i in positions]
+        return {
+            "terms": terms,
+            "positions": positions,
+            "rows": dict(zip(terms, range(len(terms)))),
+            "best": best[positions],
+            "score_rows": row_of[scores["term"]],
+            "score_conditions": scores["condition"],
+            "scores": scores["score"],
+        }
+
+
+    def _position(self, term):
+        core = self._core()
+        try:
+            return core["positions"][core["rows"][term]]
+        except KeyError:
+            raise KeyError(term) from None
+
+
+    def _sorted_genes(self, name):
+        """Sorted gene names of every selected term: "genes" or "common".
+        All the bitsets are decoded at once (see GeneVocabulary.unpack()).
+        """
+
+        return self._memoized(("sorted", name), lambda: self._build_sorted_genes(name))
+
+
+    def _build_sorted_genes(self, name):
+        aggregate = self.aggregate
+        positions = self._core()["positions"]
+        bitsets = getattr(aggregate, name)
+        rank = self._memoized("gene ranks", lambda: _ranks(aggregate.vocabulary.genes))
+        genes = _sorted_names([bitsets[i] for i in positions], aggregate.vocabulary, rank)
+
+        if name == "common":
+            for n, i in enumerate(positions):
+                if aggregate.conditions[i] == 1 or aggregate.common[i] == 0:
+                    genes[n] = sorted(
+                        _common_genes(aggregate.conditions[i], aggregate.common[i], aggregate.vocabulary)
+                    )
+        return genes
+
+
+    def terms(self):
+        """<list> of the terms, sorted."""
+
+        return list(self._core()["terms"])
+
+
+    def genes(self, term):
+        """All the genes of <term>, as a GeneSet."""
+
+        return GeneSet(self.aggregate.genes[self._position(term)], self.aggregate.vocabulary)
+
+
+    def common(self, term):
+        """The genes of <term> common to all the conditions it was found in
+        (or a placeholder, as in the "common" key of a record).
+        """
+
+        i = self._position(term)
+        aggregate = self.aggregate
+        return _common_genes(aggregate.conditions[i], aggregate.common[i], aggregate.vocabulary)
+
+
+    def records(self):
+        """The <bestof> dict of TermRecord, as aggregate_results() returns."""
+
+        return self._memoized(
+            "records", lambda: self.aggregate.records(self.top_k, self.max_fdr)
+        )
+
+
+    def results(self, not_found=1):
+        """Table of the scores of every term in every condition, with the
+        common genes: the same as tableize_aggregated() on the records.
+        """
+
+        return self._memoized(("results", not_found), lambda: self._build_results(not_found))
+
+
+    def _build_results(self, not_found):
+        core = self._core()
+        terms = core["terms"]
+
+        # only the conditions where the selected terms were found
+        used, columns = np.unique(core["score_conditions"], return_inverse=True)
+        names = [self.aggregate.condition_names[c] for c in used.tolist()]
+
+        dtype = float if isinstance(not_found, (int, float)) else object
+        matrix = np.full((len(terms), len(names)), not_found, dtype=dtype)
+        matrix[core["score_rows"], columns] = core["scores"]
+
+        df = pd.DataFrame(matrix, index=pd.Index(terms, name="term"), columns=names)
+        if len(terms) > 0:
+            # as str() of the "common" sets of the records
+            df["common"] = [
+                "{" + ", ".join(repr(x) for x in genes) + "}" if len(genes) > 0 else "set()"
+                for genes in self._sorted_genes("common")
+            ]
+
+        return df[sorted(df.columns)]
+
+
+    def summary(self, genes="joined"):
+        """The same table as summary() on the records: best score, number of
+        conditions, all genes and common genes of every term.
+        """
+
+        if genes not in ("joined", "list", None):
+            raise ValueError(f"genes must be 'joined', 'list' or None, not {genes!r}.")
+
+        return self._memoized(("summary", genes), lambda: self._build_summary(genes))
+
+
+    def _build_summary(self, genes):
+        core = self._core()
+        terms = core["terms"]
+
+        columns = {
+            "score": core["best"],
+            "occurrence": np.bincount(core["score_rows"], minlength=len(terms)).astype(np.int64),
+        }
+        if genes is not None:
+            all_genes = self._sorted_genes("genes")
+            common_genes = self._sorted_genes("common")
+            if genes == "joined":
+                # an empty gene list is a missing value, like in a parsed table
+                all_genes = [",".join(x) or np.nan for x in all_genes]
+                common_genes = [",".join(x) or np.nan for x in common_genes]
+            else:
+                all_genes = [list(x) for x in all_genes]
+                common_genes = [list(x) for x in common_genes]
+            columns["all_genes"] = all_genes
+            columns["common_genes"] = common_genes
+
+        return pd.DataFrame(columns, index=pd.Index(terms, name="ID"))\
+        .sort_values(by="score", ascending=False)
+
+
+# gene index ===============================================================
+
+# the direction of a row is the start of the name of its file
+_DIRECTION_NAMES = {"UP": "UP", "DO": "DOWN", "AL": "ALL"}
+
+_GENE_INDEX_DTYPE = np.dtype([
+    ("gene", np.int32), ("kind", np.int32), ("term", np.int32),
+    ("condition", np.int32), ("direction", np.int8), ("score", np.float64),
+])
+_GENE_INDEX_VERSION = 1
+
+
+class GeneIndex:
+
+    """Inverted index of the String tables read: for every gene, each
+    (kind, term, condition, direction, FDR) it was found in.
+
+    Pass one to aggregate_results(), aggregate_all() or write_all_*() as
+    gene_index=, and it is filled while the tables are aggregated, for
+    every kind and direction read:
+
+    index = GeneIndex()
+    aggregated = aggregate_all(directories, gene_index=index)
+    index.lookup("Sox2")           # DataFrame, one row per hit
+    index.terms("Sox2", "KEGG")    # sorted <list> of terms
+    index.table()                  # one row per gene
+    index.save("gene_index.npz")   # GeneIndex.load() reads it back
+
+    Rows are kept sorted by gene, with the position where every gene
+    starts: a lookup costs the same no matter how many tables were read.
+    """
+
+    def __init__(self):
+        self.vocabulary = GeneVocabulary()
+        self._kinds = {} # name: code
+        self._terms = {}
+        self._conditions = {}
+        self._directions = {}
+        self._chunks = [] # of _GENE_INDEX_DTYPE rows, as they are added
+        self._rows = None # all rows, sorted by gene
+        self._offsets = None # rows of gene <i> are _rows[_offsets[i]:_offsets[i + 1]]
+
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+
+    def __contains__(self, gene):
+        return self.vocabulary.get(gene) is not None
+
+
+    def __repr__(self):
+        return (
+            f"GeneIndex(genes={len(self)}, kinds={list(self._kinds)}, "
+            f"rows={len(self._sorted_rows()[0])})"
+        )
+
+
+    @staticmethod
+    def _codes(values, index):
+        """Codes of the <str> <values>, adding the new ones to <index>."""
+
+        codes, uniques = pd.factorize(values)
+        mapping = np.array(
+            [index.setdefault(x, len(index)) for x in uniques], dtype=np.int64
+        )
+        return mapping[codes] if len(mapping) > 0 else codes.astype(np.int64)
+
+
+    def add(self, long, kind):
+        """Adds the long table <long> of the String tables of <kind> (see
+        _read_enrichment_long()).
+        """
+
+        if long is None or len(long.index) == 0:
+            return
+
+        row, gene_ids = _explode_genes(long, self.vocabulary)
+        chunk = np.empty(len(row), dtype=_GENE_INDEX_DTYPE)
+        chunk["gene"] = gene_ids
+        chunk["kind"] = self._kinds.setdefault(kind, len(self._kinds))
+        chunk["term"] = self._codes(long["term"], self._terms)[row]
+        chunk["condition"] = self._codes(long["condition"], self._conditions)[row]
+        chunk["direction"] = self._codes(long["direction"], self._directions)[row]
+        chunk["score"] = long["score"].to_numpy(dtype=np.float64)[row]
+
+        self._chunks.append(chunk)
+        self._rows = self._offsets = None
+
+
+    def _sorted_rows(self):
+        if self._rows is None:
+            rows = (
+                np.concatenate(self._chunks) if len(self._chunks) > 0
+                else np.zeros(0, dtype=_GENE_INDEX_DTYPE)
+            )
+            rows = rows[np.argsort(rows["gene"], kind="stable")]
+            offsets = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows["gene"], minlength=len(self.vocabulary)), out=offsets[1:])
+            self._chunks = [rows]
+            self._rows, self._offsets = rows, offsets
+        return self._rows, self._offsets
+
+
+    def _names(self, index):
+        return np.array(list(index), dtype=object)
+
+
+    def genes(self):
+        """<list> of all the genes, sorted."""
+
+        return sorted(self.vocabulary.genes)
+
+
+    def _gene_rows(self, gene):
+        ID = self.vocabulary.get(gene)
+        if ID is None:
+            return np.zeros(0, dtype=_GENE_INDEX_DTYPE)
+        rows, offsets = self._sorted_rows()
+        return rows[offsets[ID]:offsets[ID + 1]]
+
+
+    def _frame(self, rows, genes=None):
+        directions = {
+            code: _DIRECTION_NAMES.get(x, x) for x, code in self._directions.items()
+        }
+        columns = {}
+        if genes is not None:
+            columns["gene"] = genes
+        columns.update({
+            "kind": self._names(self._kinds)[rows["kind"]],
+            "term": self._names(self._terms)[rows["term"]],
+            "condition": self._names(self._conditions)[rows["condition"]],
+            "direction": np.array(
+                [directions[i] for i in range(len(directions))], dtype=object
+            )[rows["direction"]],
+            "FDR": rows["score"],
+        })
+        return pd.DataFrame(columns)
+
+
+    def lookup(self, gene, kind=None, direction=None, max_fdr=None):
+        """Every time <gene> was found, as a DataFrame with columns kind,
+        term, condition, direction ("UP", "DOWN" or "ALL") and FDR. It is
+        empty if the gene was never found.
+
+        Rows can be limited to a <kind>, a <direction>, and to an FDR of
+        at most <max_fdr>.
+        """
+
+        rows = self._gene_rows(gene)
+        if kind is not None:
+            rows = rows[rows["kind"] == self._kinds.get(kind, -1)]
+        if direction is not None:
+            rows = rows[rows["direction"] == self._directions.get(direction[:2], -1)]
+        if max_fdr is not None:
+            rows = rows[rows["score"] <= max_fdr]
+        return self._frame(rows)
+
+
+    def terms(self, gene, kind=None):
+        """Sorted <list> of the terms <gene> was found in."""
+
+        rows = self._gene_rows(gene)
+        if kind is not None:
+            rows = rows[rows["kind"] == self._kinds.get(kind, -1)]
+        return sorted(self._names(self._terms)[np.unique(rows["term"])].tolist())
+
+
+    def conditions(self, gene, kind=None):
+        """Sorted <list> of the conditions <gene> was found in."""
+
+        rows = self._gene_rows(gene)
+        if kind is not None:
+            rows = rows[rows["kind"] == self._kinds.get(kind, -1)]
+        return sorted(self._names(self._conditions)[np.unique(rows["condition"])].tolist())
+
+
+    def long(self):
+        """All the rows, as a DataFrame sorted by gene, with the columns
+        of lookup() and a gene column in front.
+        """
+
+        rows, _ = self._sorted_rows()
+        genes = np.array(self.vocabulary.genes, dtype=object)[rows["gene"]]
+        df = self._frame(rows, genes)
+        order = np.argsort(_ranks(self.vocabulary.genes)[rows["gene"]], kind="stable")
+        return df.iloc[order].reset_index(drop=True)
+
+
+    def table(self):
+        """Gene-centric table: for every gene, the number of terms and of
+        conditions it was found in, its best (lowest) FDR, and the kinds
+        and directions it was found in.
+        """
+
+        rows, offsets = self._sorted_rows()
+        n_genes = len(self.vocabulary)
+        present = np.flatnonzero(np.diff(offsets) > 0)
+        starts = offsets[present]
+
+        def distinct(key):
+            # number of different <key> values of every gene
+            width = int(key.max()) + 1 if len(key) > 0 else 1
+            pairs = np.unique(rows["gene"].astype(np.int64) * width + key)
+            return np.bincount(pairs // width, minlength=n_genes)[present]
+
+        def joined(codes, names):
+            # sorted, comma-joined names of the codes of every gene
+            masks = np.bitwise_or.reduceat(np.left_shift(1, codes.astype(np.int64)), starts)
+            names = list(names)
+            labels = {
+                mask: ",".join(sorted(names[i] for i in range(len(names)) if mask >> i & 1))
+                for mask in np.unique(masks).tolist()
+            }
+            return [labels[x] for x in masks.tolist()]
+
+        directions = [_DIRECTION_NAMES.get(x, x) for x in self._directions]
+        df = pd.DataFrame(
+            {
+                "terms": distinct(rows["kind"].astype(np.int64) * max(len(self._terms), 1) + rows["term"]),
+                "conditions": distinct(rows["condition"].astype(np.int64)),
+                "best FDR": np.fmin.reduceat(rows["score"], starts) if len(starts) > 0 else [],
+                "kinds": joined(rows["kind"], self._kinds),
+                "directions": joined(rows["direction"], directions),
+            },
+            index=pd.Index(
+                np.array(self.vocabulary.genes, dtype=object)[present], name="gene"
+            ),
+        )
+        return df.sort_index()
+
+
+    def save(self, file):
+        """Writes the index to <file> (a .npz file)."""
+
+        rows, offsets = self._sorted_rows()
+        arrays = {}
+        for name, strings in (
+            ("genes", self.vocabulary.genes),
+            ("kinds", list(self._kinds)),
+            ("terms", list(self._terms)),
+            ("conditions", list(self._conditions)),
+            ("directions", list(self._directions)),
+        ):
+            arrays[name], arrays[name + "_offsets"] = _encode_strings(strings)
+
+        np.savez(
+            file,
+            version=np.int64(_GENE_INDEX_VERSION),
+            rows=rows,
+            offsets=offsets,
+            **arrays,
+        )
+
+
+    @classmethod
+    def load(cls, file):
+        """Reads an index written by save()."""
+
+        with np.load(file, allow_pickle=False) as data:
+            if int(data["version"]) != _GENE_INDEX_VERSION:
+                raise ValueError(f"{file}: unsupported gene index version {int(data['version'])}")
+
+            index = cls()
+            strings = {
+                name: _decode_strings(data[name], data[name + "_offsets"])
+                for name in ("genes", "kinds", "terms", "conditions", "directions")
+            }
+            index.vocabulary = GeneVocabulary(strings["genes"])
+            index._kinds = {x: i for i, x in enumerate(strings["kinds"])}
+            index._terms = {x: i for i, x in enumerate(strings["terms"])}
+            index._conditions = {x: i for i, x in enumerate(strings["conditions"])}
+            index._directions = {x: i for i, x in enumerate(strings["directions"])}
+            index._rows = data["rows"]
+            index._offsets = data["offsets"]
+            index._chunks = [index._rows]
+
+        return index
+
+
+def _aggregate_streaming(directories, kinds, ways, header_table, say,
+                         workers=None, PATH=PATH, cache=False,
+                         memory_budget=512 * 2**20, partial=False,
+                         top_k=None, max_fdr=None, report=_NO_REPORT, lazy=False,
+                         gene_index=None):
+    """Memory-bounded version of _walk_directories() + _results(), for
+    every kind and way at once.
+
+    The partial aggregates of the directories (and their tables, for
+    <gene_index>) are merged in batches that take about half of
+    <memory_budget> (bytes), and the scores are kept on disk until the end
+    (see _StreamingAggregate).
+
+    Returns: {(way, kind): bestof}, or {(way, kind): PartialAggregate}
+    if <partial>, or {(way, kind): AggregationResult} if <lazy>
+    """
+
+    vocabulary = GeneVocabulary() # shared, so that gene names are stored once
+
+    with tempfile.TemporaryDirectory(prefix="restring-") as spill_dir:
+        states = {
+            (tuple(way), kind): _StreamingAggregate(
+                os.path.join(spill_dir, f"{n}.scores"), kind, way, vocabulary
+            )
+            for n, (way, kind) in enumerate((way, kind) for way in ways for kind in kinds)
+        }
+
+        def flush(batch):
+            say(f"Aggregating a batch of {len(batch)} directories.", stage="aggregation")
+            for kind in kinds:
+                tables = [
+                    dir_tables[kind] for _, dir_tables in batch
+                    if dir_tables.get(kind) is not None
+                ]
+                if gene_index is not None and len(tables) > 0:
+                    gene_index.add(pd.concat(tables, ignore_index=True), kind)
+                for way in ways:
+                    state = states[tuple(way), kind]
+                    with report.stage("aggregation", name=state._label()):
+                        state._absorb(PartialAggregate._merge_arrays(
+                            [dir_partials[tuple(way), kind] for dir_partials, _ in batch],
+                            kind, way, vocabulary
+                        ))
+
+        batch, batch_size = [], 0
+        for d, dir_partials, dir_tables in _iter_directories(
+            directories, kinds, ways, header_table, say, workers, PATH, cache, report,
+            keep_tables=gene_index is not None
+        ):
+            batch.append((dir_partials, dir_tables))
+            batch_size += sum(
+                array.nbytes for arrays in dir_partials.values() for array in arrays.values()
+            ) + sum(
+                table.memory_usage(deep=True).sum()
+                for table in dir_tables.values() if table is not None
+            )
+            if batch_size >= memory_budget // 2:
+                flush(batch)
+                batch, batch_size = [], 0
 
-    returnlist = []
-    for x in listlike:
-        for y in wanted:
-            if y in x:
-                returnlist.append(x)
-                break
+        if len(batch) > 0:
+            flush(batch)
 
-    return returnlist
+        if partial or lazy:
+            return {
+                key: _results(state.detach(), partial, top_k, max_fdr, report, lazy)
+                for key, state in states.items()
+            }
+        return {key: state.records(top_k, max_fdr, report) for key, state in states.items()}
 
 
-# ===============================================================
+def _results(aggregate, partial=False, top_k=None, max_fdr=None, report=_NO_REPORT,
+             lazy=False):
+    """Builds the <bestof> dict out of the PartialAggregate <aggregate>
+    of all the directories read. "genes" and "common" are GeneSet
+    objects, that work like <set>.
+
+    If <partial>, returns the PartialAggregate itself, and if <lazy>, an
+    AggregationResult.
+    """
+
+    if partial:
+        return aggregate
+    if lazy:
+        return aggregate.result(top_k, max_fdr)
+    return aggregate.records(top_k, max_fdr, report)
 
-# ===============================================================
 
 def aggregate_results(
     directories,
     kind="KEGG",
     directions=["UP", "DOWN"],
     verbose=True,
+    workers=None,
+    cache=False,
+    memory_budget=None,
+    partial=False,
+    lazy=False,
+    top_k=None,
+    max_fdr=None,
+    report=None,
+    progress=None,
+    gene_index=None,
 
     # -- settings.py --
 
@@ -240,9 +2767,14 @@ def aggregate_results(
     Walks the given <directories> list, and reads the String .tsv files of
     defined <kind>.
 
+    The tables of each directory are concatenated into one long table (term,
+    condition, score, genes), that is aggregated all at once; then the
+    partial aggregates of all directories are merged (see PartialAggregate).
+
     Params:
     =======
-    directories: <list> of directories where to look for String files
+    directories: <list> of directories where to look for String files.
+             Relative paths are looked for in <PATH>
 
     kind:    <str> Defines the String filetype to process. Kinds defined in
              settings.file_types
@@ -254,6 +2786,54 @@ def aggregate_results(
 
     verbose: <bool>; turns verbose mode on or off
 
+    workers: <int>; if more than 1, directories are read and aggregated in
+             parallel by this many processes, that send back the partial
+             aggregate of each. The result is the same as with workers=None.
+
+    cache:   <bool>; if True, the partial aggregates of each directory are
+             cached as .npz files in a hidden folder in that same directory
+             (CACHE_DIR), along with the size and modification time of every
+             String file they were made from. Following runs only read the
+             files of the directories that changed since.
+
+    memory_budget: <int> bytes; if given, directories are read and
+             aggregated in batches that take about half of this memory,
+             keeping only a running intersection of the common genes of
+             each term, and spilling the scores to a temporary file on
+             disk. Meant for thousands of directories; the result is the
+             same. The budget bounds reading and aggregating, not the
+             result: the records are built from the spilled scores a chunk
+             at a time, but they hold a (terms x conditions) matrix of
+             8-byte scores; with partial or lazy, every score (24 bytes
+             each) is read back in memory. top_k and max_fdr make the
+             records smaller.
+
+    partial: <bool>; if True, returns a PartialAggregate instead, that can
+             be saved and merged with the ones of other directories (for
+             example, aggregated on other machines). Its records() method
+             returns the usual dict.
+
+    lazy:    <bool>; if True, returns an AggregationResult instead, that
+             builds the records, the results table and the summary table
+             only when asked for, straight from the aggregated arrays.
+
+    top_k:   <int>; if given, only the <top_k> terms with the lowest (best)
+             score are returned. Only these terms get a record built.
+
+    max_fdr: <float>; if given, only the terms whose best score is at most
+             <max_fdr> are returned.
+
+    report:  a Report; if given, the time, rows, bytes and peak memory of
+             every file read and of every stage are recorded in it.
+
+    progress: a Progress; if given, the messages are posted to it as
+             progress events (stage, file, counts) instead of being
+             printed, whatever <verbose> is.
+
+    gene_index: a GeneIndex; if given, every gene of the tables read is
+             added to it, with the terms, conditions, directions and FDR
+             it was found with.
+
 
     Returns: <dict>
     ========
@@ -266,22 +2846,21 @@ def aggregate_results(
                          "exp condition2": <float>
                          "hightes pval"  : <float>
              - {term2} - ...
+
+    Every term is a TermRecord, that can be used as a <dict> with the
+    keys above.
              
     Call tableize_aggregated() on this dict to build a table
     """
     
-    os.chdir(PATH)
-    
-    def say(*args, **kwargs):
-        if verbose:
-            print(*args, **kwargs)
+    say = _sayer(verbose, progress)
+
+    if report is None:
+        report = _NO_REPORT
     
     say("Start walking the directory structure.\n")
     say(f"Parameters\n{'-'*10}\nfolders: {len(directories)}\nkind={kind}\ndirections={directions}\n")
     
-    PROCESSED_DIRS = 0
-    PROCESSED_FILES = 0
-    
     if not isinstance(directions, list):
         try:
             # supplied a string? check if that's a valid direction
@@ -298,129 +2877,259 @@ def aggregate_results(
     if kind not in file_types:
         raise TypeError(f"STRING analysis type must be one of these:\n{file_types}")
     
-    bestof = {}
-    
-    # ID : the column name of the wanted name (process, KEGG, ..)
-    # score: the column name or the wanted score (likely the false discovery rate or pval)
-    # TERM_ID: the actual term to be retrieved
-    # SCORE: the actual float score
-    # gene_names: the column where the genes per term are stored
-    
-    # picking the header handles form settings.header_table
-    # as of now, this is superfluous as all tables share the same layout. Should
-    # this change in the future, just update settings.header_table
-    ID, score, gene_names = header_table[kind].values()
-                    
+    if partial and (top_k is not None or max_fdr is not None):
+        raise ValueError(
+            "top_k and max_fdr pick terms of the final results: with partial=True, "
+            "pass them to records() of the merged PartialAggregate."
+        )
+
+    if partial and lazy:
+        raise ValueError("partial=True and lazy=True can not be used together.")
+
     # start walking the directories
     # =============================
-    for d in directories:
-        PROCESSED_DIRS += 1
-        say(f"Processing directory: {d}")
-        os.chdir(d)
-        
-        files = glob("*enrichment."+kind+".tsv")
-        if len(files) > 0:
-            for file in files: # either UP and/or DOWN
-                
-                if file[:2] in [x[:2] for x in directions]:
-                    PROCESSED_FILES += 1
-                    say(f"\tProcessing file {file}")
-
-                    df = pd.read_csv(file, sep=sep, index_col=ID)
-                    for TERM_ID in df.index:
-                        # we are adding the first key to <bestof>.
-                        # this key is the retrieved term.
-                        # in this sub-dict, the first keys to be added
-                        # are the following, then followed by all
-                        # <d> (directory names, == experimental groups)
-                        #
-                        #
-                        # bestof -- TERM -- "highest score" <float>
-                        #               --- "genes" <set>
-                        #               --- "common_temp" <dict>
-                        #               --- "directory_1" <float>
-                        #               --- "directory 2" <float>
-                        #               --- ...
-                        #        -- TERM2 - ...
-                        #
-                        bestof.setdefault(TERM_ID, {})
-                        bestof[TERM_ID].setdefault("highest score", 1)
-                        bestof[TERM_ID].setdefault("genes", set())
-                        bestof[TERM_ID].setdefault("common_temp", dict())
-                        
-                        # adding a key (d - the directory) to the sub dict
-                        # storing the pvalue of that term, for future heatmap
-                        SCORE = df.loc[TERM_ID, score]
-                        bestof[TERM_ID][d] = SCORE
-                        if bestof[TERM_ID]["highest score"] > SCORE:
-                            bestof[TERM_ID]["highest score"] = SCORE
-                        
-                        GENES = df.loc[TERM_ID, gene_names]
-                        GENES = GENES.split(",")
-                        bestof[TERM_ID]["genes"].update(set(GENES))
-                        
-                        # things get tricky. I'm looping over the directories,
-                        # not terms. Now I have to store all genes for every
-                        # directory, then only at the end I have to find
-                        # the common elements
-                        GENES = df.loc[TERM_ID, gene_names]
-                        GENES = GENES.split(",")
-                        bestof[TERM_ID]["common_temp"].setdefault(d, set(GENES))
-        
-        os.chdir("..")
-    
-    # final thing to do: loop over TERM_ID (bestof keys) and find the common genes,
-    # then deleting individual sets
-    
-    for k in bestof.keys():
-        curr = bestof[k]["common_temp"] # <dict>
-        conditions = list(curr.keys())
-        
-        first_key = conditions.pop() # <set>
-        first_set = curr[first_key]
-        
-        if len(conditions) > 0:
-            for other_keys in conditions:
-                first_set = first_set.intersection(curr[other_keys])
-
-            # now first_set contains all genes that are commonly picked up in all conditions
-            if len(first_set) == 0:
-                first_set = set(list(["No common gene"]))
-            
-            
-            del bestof[k]["common_temp"]
-            bestof[k]["common"] = first_set
-        else: # there is just one condition
-            del bestof[k]["common_temp"]
-            bestof[k]["common"] = set(list(["n/a (just one condition)"]))
-        
+    if memory_budget is not None:
+        bestof = _aggregate_streaming(
+            directories, [kind], [directions], header_table, say, workers, PATH,
+            cache, memory_budget, partial, top_k, max_fdr, report, lazy, gene_index
+        )[tuple(directions), kind]
+    else:
+        aggregate = _walk_directories(
+            directories, [kind], [directions], header_table, say, workers, PATH, cache, report,
+            gene_index
+        )[tuple(directions), kind]
+        bestof = _results(aggregate, partial, top_k, max_fdr, report, lazy)
         
-    say(f"\nProcessed {PROCESSED_DIRS} directories and {PROCESSED_FILES} files.")
-    say(f"Found a total of {len(bestof)} {kind} elements.")
+    say(f"Found a total of {len(bestof)} {kind} elements.", stage="aggregation", name=kind)
     
     return bestof
 
 
-def summary(dictlike):
-    
-    returnstring="ID\tscore\toccurrence\tall_genes\tcommon_genes\n"
-    keys = sorted(dictlike.keys())
-    for k in keys:
-        occurrences = len(dictlike[k]) -3 # there are three hard-coded keys
+def aggregate_all(
+    directories,
+    ways=[["UP"], ["DOWN"], ["UP", "DOWN"]],
+    kind="all",
+    verbose=True,
+    workers=None,
+    cache=False,
+    memory_budget=None,
+    partial=False,
+    lazy=False,
+    top_k=None,
+    max_fdr=None,
+    report=None,
+    progress=None,
+    gene_index=None,
 
-        pval = dictlike[k]["highest score"]
-        all_genes = ",".join(sorted(dictlike[k]["genes"]))
-        common_genes = ",".join(sorted(dictlike[k]["common"]))
-        
-        returnstring += k+"\t"+str(pval)+"\t"+str(occurrences)+"\t"+all_genes+"\t"+common_genes+"\n"
+    # -- settings.py --
+
+    file_types=file_types,
+    PATH=PATH,
+    header_table=header_table,
+):
+
+    """
+    Same as aggregate_results(), but for many kinds and directions at once.
+    The <directories> are walked a single time, and every String .tsv file
+    is read only once, no matter how many <ways> it takes part in.
+
+    Params:
+    =======
+    directories: <list> of directories where to look for String files.
+             Relative paths are looked for in <PATH>
+
+    ways:    <list> of directions lists, for example [["UP"], ["UP", "DOWN"]].
+             Each one is aggregated separately (see aggregate_results())
+
+    kind:    "all", or a <str> or <list> of String filetypes, as defined
+             in settings.file_types
+
+    verbose: <bool>; turns verbose mode on or off
+
+    workers: <int>; if more than 1, directories are read and aggregated in
+             parallel by this many processes (see aggregate_results())
+
+    cache:   <bool>; caches the aggregates of each directory, and only reads
+             the files that changed since the last run (see aggregate_results())
+
+    memory_budget: <int> bytes; aggregates in memory-bounded batches
+             (see aggregate_results())
+
+    partial: <bool>; returns PartialAggregate objects instead of dicts
+             (see aggregate_results())
+
+    lazy:    <bool>; returns AggregationResult objects instead of dicts
+             (see aggregate_results())
+
+    top_k, max_fdr: only keep the best terms of every way and kind
+             (see aggregate_results())
+
+    report:  a Report, that records every file read and every stage
+             (see aggregate_results())
+
+    progress: a Progress, where the messages are posted instead of being
+             printed (see aggregate_results())
+
+    gene_index: a GeneIndex, that is filled with the genes of all the
+             tables read (see aggregate_results())
+
+
+    Returns: <dict>
+    ========
+
+    {(way, kind): bestof}, where <way> is a <tuple> like ("UP", "DOWN") and
+    <bestof> is what aggregate_results() returns for that way and kind.
+    Empty aggregations are included as empty dicts.
+    """
+
+    say = _sayer(verbose, progress)
+
+    if report is None:
+        report = _NO_REPORT
+
+    if kind == "all":
+        kinds = file_types
+    elif isinstance(kind, str):
+        kinds = [kind]
+    elif isinstance(kind, (list, tuple)):
+        kinds = kind
+    else:
+        raise TypeError(f"kind parameter must be one of: {file_types}")
+
+    for k in kinds:
+        if k not in file_types:
+            raise TypeError(f"STRING analysis type must be one of these:\n{file_types}")
+
+    if partial and (top_k is not None or max_fdr is not None):
+        raise ValueError(
+            "top_k and max_fdr pick terms of the final results: with partial=True, "
+            "pass them to records() of the merged PartialAggregate."
+        )
+
+    if partial and lazy:
+        raise ValueError("partial=True and lazy=True can not be used together.")
+
+    ways = [[way] if isinstance(way, str) else way for way in ways]
+
+    say("Start walking the directory structure.\n")
+    say(f"Parameters\n{'-'*10}\nfolders: {len(directories)}\nkinds={kinds}\nways={ways}\n")
+
+    if memory_budget is not None:
+        aggregated = _aggregate_streaming(
+            directories, kinds, ways, header_table, say, workers, PATH,
+            cache, memory_budget, partial, top_k, max_fdr, report, lazy, gene_index
+        )
+        for (way, k), bestof in aggregated.items():
+            say(f"{'+'.join(way)}: found a total of {len(bestof)} {k} elements.", stage="aggregation", name=k)
+        return aggregated
+
+    aggregates = _walk_directories(
+        directories, kinds, ways, header_table, say, workers, PATH, cache, report,
+        gene_index
+    )
+
+    aggregated = {}
+    for way in ways:
+        for k in kinds:
+            bestof = _results(aggregates[tuple(way), k], partial, top_k, max_fdr, report, lazy)
+
+            say(f"{'+'.join(way)}: found a total of {len(bestof)} {k} elements.", stage="aggregation", name=k)
+            aggregated[tuple(way), k] = bestof
+
+    return aggregated
+
+
+def _stacked_scores(records):
+    """If all <records> are TermRecord of the same aggregation (sharing
+    their positions), returns their scores as a (records x conditions)
+    array, NaN where a term was not found, and the shared positions.
+    Otherwise returns None, None.
+    """
+
+    positions = getattr(records[0], "positions", None) if len(records) > 0 else None
+    if positions is None or not all(
+        isinstance(term, TermRecord) and term.positions is positions for term in records
+    ):
+        return None, None
+
+    scores = np.full((len(records), len(positions)), np.nan)
+    for i, term in enumerate(records):
+        scores[i, :len(term.values)] = term.values
+    return scores, positions
+
+
+def summary(dictlike, genes="joined", report=None):
+
+    """Summarizes the aggregated terms (see aggregate_results()): for every
+    term, its best score, the number of conditions it was found in, all
+    of its genes and the genes common to all conditions.
+
+    Params:
+    =======
+
+    dictlike  <dict> of aggregated terms (TermRecord or <dict>), or an
+              AggregationResult.
+
+    genes     How the all_genes and common_genes columns are filled:
+              "joined": comma-joined <str> of the sorted genes (default)
+              "list":   sorted <list> of genes
+              None:     the two columns are not built at all
+
+    report    A Report, where the time it takes is recorded.
+
+    Returns:
+    ========
     
-    df = pd.read_csv(StringIO(returnstring), index_col=0, sep="\t").sort_values\
-    (by="score", ascending=False)
+    <pd.DataFrame> indexed by term ID, sorted by descending score.
+    """
+    if genes not in ("joined", "list", None):
+        raise ValueError(f"genes must be 'joined', 'list' or None, not {genes!r}.")
+
+    start = perf_counter()
+    if isinstance(dictlike, AggregationResult):
+        df = dictlike.summary(genes).copy()
+        if report is not None:
+            report.add("summary", seconds=perf_counter() - start, rows=len(df.index))
+        return df
+
+    keys = sorted(dictlike.keys())
+    records = [dictlike[k] for k in keys]
+    scores = np.empty(len(keys), dtype=float)
+    stacked, _ = _stacked_scores(records)
+    if stacked is not None:
+        occurrences = np.count_nonzero(~np.isnan(stacked), axis=1).astype(np.int64)
+    else:
+        occurrences = np.empty(len(keys), dtype=np.int64)
+    for i, term in enumerate(records):
+        scores[i] = term["highest score"]
+        if stacked is None:
+            if isinstance(term, TermRecord):
+                occurrences[i] = len(term.conditions)
+            else:
+                occurrences[i] = sum(1 for key in term if key not in _AGGREGATION_KEYS)
+
+    columns = {"score": scores, "occurrence": occurrences}
+    if genes is not None:
+        # gene sets of the same aggregation are decoded all at once
+        all_genes = _sorted_gene_sets([term["genes"] for term in records])
+        common_genes = _sorted_gene_sets([term["common"] for term in records])
+        if genes == "joined":
+            # an empty gene list is a missing value, like in a parsed table
+            all_genes = [",".join(x) or np.nan for x in all_genes]
+            common_genes = [",".join(x) or np.nan for x in common_genes]
+        columns["all_genes"] = all_genes
+        columns["common_genes"] = common_genes
+
+    df = pd.DataFrame(columns, index=pd.Index(keys, name="ID"))\
+    .sort_values(by="score", ascending=False)
+
+    if report is not None:
+        report.add("summary", seconds=perf_counter() - start, rows=len(df.index))
     
     return df
 
 
-def tableize_aggregated(dictlike, terms=None, not_found=1):
+def tableize_aggregated(dictlike, terms=None, not_found=1, report=None, progress=None):
     
     """The structure of dictlike is as follows:
     
@@ -429,96 +3138,192 @@ def tableize_aggregated(dictlike, terms=None, not_found=1):
                          "exp condition2": float
                          "hightes pval": float
              - {term2} - ...
+
+    Returns a table with terms as index and a column per experimental
+    condition, holding the scores. Terms that were not found in a
+    condition get <not_found>. If present, the "common" genes are kept
+    in a column of their own.
+
+    <dictlike> can also be an AggregationResult.
+
+    terms     If a <list> of terms is given, only these rows are kept.
+
+    report    A Report, where the time it takes is recorded.
+
+    progress  A Progress, where the messages are posted instead of being
+              printed.
     """
+    start = perf_counter()
+    if isinstance(dictlike, AggregationResult):
+        df = dictlike.results(not_found).copy()
+        if terms is not None:
+            if isinstance(terms, str):
+                terms = [terms]
+            df = df[df.index.isin(list(terms))]
+        if report is not None:
+            report.add("tableize", seconds=perf_counter() - start, rows=len(df.index))
+        return df
+
     if not isinstance(dictlike, dict):
-        print(f"'dictlike' must be a dictionary, as the name suggests.")
+        _sayer(True, progress)(f"'dictlike' must be a dictionary, as the name suggests.")
         return -1
     
-    from io import StringIO
-    
-    returnstring=""
     keys = sorted(dictlike.keys())
-    
-    # pulling all possible conditions that have been picked up
-    exp_conditions = set()
-    for retrieved_term in keys: # keys are the retrieved terms
-        exp_conditions = exp_conditions.union(set(dictlike[retrieved_term].keys()))
-    exp_conditions = exp_conditions.difference(set(["highest score"]))
-    exp_conditions = exp_conditions.difference(set(["genes"]))
-    
-    
-    exp_conditions = sorted(list(exp_conditions))
-    returnstring += "term\t"
-    returnstring += "\t".join(exp_conditions)
-    returnstring += "\n"
-    
-    if terms is None:
-        for retrieved_term in keys:
-            returnstring += retrieved_term + "\t"
-            for exp_condition in exp_conditions:
-                returnstring += str(
-                    dictlike[retrieved_term].get(exp_condition, not_found)
-                )
-                returnstring += "\t"
-            returnstring = returnstring[:-1] + "\n"
+    records = [dictlike[k] for k in keys]
+
+    if isinstance(not_found, (int, float)):
+        dtype = float
     else:
-        for retrieved_term in keys:
-            if retrieved_term in terms:
-                returnstring += retrieved_term + "\t"
-                for exp_condition in exp_conditions:
-                    returnstring += str(
-                        dictlike[retrieved_term].get(exp_condition, not_found)
-                    )
-                    returnstring += "\t"
-                returnstring = returnstring[:-1] + "\n"
-            else:
+        dtype = object
+
+    scores, positions = _stacked_scores(records)
+    if scores is not None:
+        # records of the same aggregation: no need to look at every key
+        found = ~np.isnan(scores)
+        used = np.flatnonzero(found.any(axis=0))
+        names = list(positions)
+        columns = [names[j] for j in used.tolist()]
+
+        matrix = np.full((len(keys), len(used)), not_found, dtype=dtype)
+        found = found[:, used]
+        matrix[found] = scores[:, used][found]
+        common = {
+            i: str(term.common) for i, term in enumerate(records) if term.common is not None
+        }
+
+    else:
+        # the scores are collected as (row, column, value) coordinates, then
+        # put in the table all at once
+        exp_conditions = {} # condition: column number
+        rows, cols, values = [], [], []
+        common = {}
+        for i, term in enumerate(records): # keys are the retrieved terms
+            if isinstance(term, TermRecord):
+                # no need to look at every key
+                for exp_condition, value in term.condition_scores().items():
+                    rows.append(i)
+                    cols.append(exp_conditions.setdefault(exp_condition, len(exp_conditions)))
+                    values.append(value)
+                if term.common is not None:
+                    common[i] = str(term.common)
                 continue
-    
-    df = pd.read_csv(StringIO(returnstring), index_col=0, sep="\t").sort_values\
-    (by="term", ascending=True)
+
+            for exp_condition, value in term.items():
+                if exp_condition == "common":
+                    common[i] = str(value)
+                    continue
+                if exp_condition in _AGGREGATION_KEYS:
+                    continue
+                rows.append(i)
+                cols.append(exp_conditions.setdefault(exp_condition, len(exp_conditions)))
+                values.append(value)
+
+        matrix = np.full((len(keys), len(exp_conditions)), not_found, dtype=dtype)
+        matrix[rows, cols] = values
+        columns = list(exp_conditions)
+
+    df = pd.DataFrame(
+        matrix,
+        index=pd.Index(keys, name="term"),
+        columns=columns,
+    )
+
+    if len(common) > 0:
+        df["common"] = [common.get(i, str(not_found)) for i in range(len(keys))]
+
+    df = df[sorted(df.columns)]
+
+    if terms is not None:
+        if isinstance(terms, str):
+            terms = [terms]
+        df = df[df.index.isin(list(terms))]
+
+    if report is not None:
+        report.add("tableize", seconds=perf_counter() - start, rows=len(df.index))
     
     return df
 
 
 def write_all_aggregated(
-    directories,
+    directories=None,
     ways=[["UP"], ["DOWN"], ["UP", "DOWN"]],
-    kind="all", prefix="aggregated",
+    kind="all", prefix="aggregated", aggregated=None, PATH=PATH, report=None,
+    progress=None, gene_index=None,
     # wanted = "all", # TODO: enable custom table slicing
     ):
 
     """
+    Writes one 'results' table (see tableize_aggregated()) for every
+    combination of <ways> and <kind>.
+
+    aggregated   What aggregate_all() returns. If None, the directories are
+              aggregated here. Pass the same <aggregated> to
+              write_all_summarized() to read the String files only once:
+
+              aggregated = aggregate_all(directories)
+              write_all_aggregated(directories, aggregated=aggregated)
+              write_all_summarized(directories, aggregated=aggregated)
+
+              <directories> can then be left out (None): it is only used
+              to aggregate them here.
+
+    PATH      The directory the String files are looked for, and where the
+              tables are written.
+
+    report    A Report: the time, rows and bytes of every stage are
+              recorded in it, and it is saved as JSON next to the tables
+              ('aggregated_report.json').
+
+    progress  A Progress, where the messages are posted instead of being
+              printed (see aggregate_results()).
+
+    gene_index  A GeneIndex: it is filled while the directories are
+              aggregated here, and written next to the tables (see
+              write_gene_index(): 'aggregated_gene_index.npz' and .csv).
     """
 
-    print(f"Start invoking aggregate_results() with following parameters:\n{'-'*60}\n")
-    print(f"Batch processing directories: {directories}")
-    print(f"Enrichment tables following those patterns: {ways}")
-    print(f"Enrichment tables for the following types: {kind}")
-    print(f"Tables will be written prepended with this prefix: '{prefix}'\n")
+    say = _sayer(True, progress)
+
+    if directories is None and aggregated is None:
+        raise ValueError("Either the directories or what aggregate_all() returns (aggregated=) must be given.")
+
+    say(f"Start invoking aggregate_results() with following parameters:\n{'-'*60}\n")
+    if directories is not None:
+        say(f"Batch processing directories: {directories}")
+    else:
+        say(f"Writing the tables of the given aggregation.")
+    say(f"Enrichment tables following those patterns: {ways}")
+    say(f"Enrichment tables for the following types: {kind}")
+    say(f"Tables will be written prepended with this prefix: '{prefix}'\n")
     
     if kind == "all":
         kinds = file_types
     else:
         if isinstance(kind, str):
-            kinds = [kinds]
+            kinds = [kind]
         elif isinstance(kind, list):
             kinds = kind
         else:
             raise TypeError(f"kind parameter must be one of: {file_types}")
 
+    # like aggregate_all(): "UP" stands for ["UP"]
+    ways = [[way] if isinstance(way, str) else way for way in ways]
+
+    if aggregated is None:
+        aggregated = aggregate_all(
+            directories, ways=ways, kind=kinds, PATH=PATH, report=report,
+            progress=progress, gene_index=gene_index,
+        )
+
     TABLES = 0
     for way in ways:
         for k in kinds:
-            db = aggregate_results(
-                directions=way,
-                kind=k,
-                directories=directories
-            )
+            db = aggregated[tuple(way), k]
 
             if len(db) == 0:
                 continue
 
-            table = tableize_aggregated(db)
+            table = tableize_aggregated(db, report=report)
             TABLES += 1
             
             # TODO: enable custom table slicing (not based on type)
@@ -528,51 +3333,103 @@ def write_all_aggregated(
             del table["common"] # detailed in summary()
             
             outfile_name = f"{prefix}_{'_'.join(way)}_{k}.csv"
-            table.to_csv(outfile_name, sep=sep)
+            if report is None:
+                table.to_csv(os.path.join(PATH, outfile_name), sep=sep)
+            else:
+                with report.stage("writing", name=outfile_name, rows=len(table.index)) as record:
+                    table.to_csv(os.path.join(PATH, outfile_name), sep=sep)
+                    record["bytes"] = os.path.getsize(os.path.join(PATH, outfile_name))
+
+    say(f"\n{'-'*60}")
+    say(f"Finished. A total of {TABLES} tables were produced.", stage="writing", done=TABLES)
+
+    if gene_index is not None:
+        write_gene_index(gene_index, prefix=f"{prefix}_gene_index", PATH=PATH)
 
-    print(f"\n{'-'*60}")
-    print(f"Finished. A total of {TABLES} tables were produced.")
+    if report is not None:
+        report.save(os.path.join(PATH, f"{prefix}_report.json"))
 
 
 def write_all_summarized(
-    directories,
+    directories=None,
     ways=[["UP"], ["DOWN"], ["UP", "DOWN"]],
-    kind="all", prefix="summary",
+    kind="all", prefix="summary", aggregated=None, PATH=PATH, report=None,
+    progress=None, gene_index=None,
     # wanted = "all", # TODO: enable custom table slicing
     ):
 
     """
+    Writes one 'summary' table (see summary()) for every
+    combination of <ways> and <kind>.
+
+    aggregated   What aggregate_all() returns. If None, the directories are
+              aggregated here. Pass the same <aggregated> to
+              write_all_aggregated() to read the String files only once:
+
+              aggregated = aggregate_all(directories)
+              write_all_aggregated(directories, aggregated=aggregated)
+              write_all_summarized(directories, aggregated=aggregated)
+
+              <directories> can then be left out (None): it is only used
+              to aggregate them here.
+
+    PATH      The directory the String files are looked for, and where the
+              tables are written.
+
+    report    A Report: the time, rows and bytes of every stage are
+              recorded in it, and it is saved as JSON next to the tables
+              ('summary_report.json').
+
+    progress  A Progress, where the messages are posted instead of being
+              printed (see aggregate_results()).
+
+    gene_index  A GeneIndex: it is filled while the directories are
+              aggregated here, and written next to the tables (see
+              write_gene_index(): 'summary_gene_index.npz' and .csv).
     """
 
-    print(f"Start invoking aggregate_results() with following parameters:\n{'-'*60}\n")
-    print(f"Batch processing directories: {directories}")
-    print(f"Enrichment tables following those patterns: {ways}")
-    print(f"Enrichment tables for the following types: {kind}")
-    print(f"Tables will be written prepended with this prefix: '{prefix}'\n")
+    say = _sayer(True, progress)
+
+    if directories is None and aggregated is None:
+        raise ValueError("Either the directories or what aggregate_all() returns (aggregated=) must be given.")
+
+    say(f"Start invoking aggregate_results() with following parameters:\n{'-'*60}\n")
+    if directories is not None:
+        say(f"Batch processing directories: {directories}")
+    else:
+        say(f"Writing the tables of the given aggregation.")
+    say(f"Enrichment tables following those patterns: {ways}")
+    say(f"Enrichment tables for the following types: {kind}")
+    say(f"Tables will be written prepended with this prefix: '{prefix}'\n")
 
     if kind == "all":
         kinds = file_types
     else:
         if isinstance(kind, str):
-            kinds = [kinds]
+            kinds = [kind]
         elif isinstance(kind, list):
             kinds = kind
         else:
             raise TypeError(f"kind parameter must be one of: {file_types}")
 
+    # like aggregate_all(): "UP" stands for ["UP"]
+    ways = [[way] if isinstance(way, str) else way for way in ways]
+
+    if aggregated is None:
+        aggregated = aggregate_all(
+            directories, ways=ways, kind=kinds, PATH=PATH, report=report,
+            progress=progress, gene_index=gene_index,
+        )
+
     TABLES = 0
     for way in ways:
         for k in kinds:
-            db = aggregate_results(
-                directions=way,
-                kind=k,
-                directories=directories
-            )
+            db = aggregated[tuple(way), k]
 
             if len(db) == 0:
                 continue
 
-            table = summary(db)
+            table = summary(db, report=report)
             TABLES += 1
             
             # TODO: enable custom table slicing (not based on type)
@@ -580,31 +3437,96 @@ def write_all_summarized(
             #    table = table.loc[wanted:]
                             
             outfile_name = f"{prefix}_{'_'.join(way)}_{k}.csv"
-            table.to_csv(outfile_name, sep=sep)
+            if report is None:
+                table.to_csv(os.path.join(PATH, outfile_name), sep=sep)
+            else:
+                with report.stage("writing", name=outfile_name, rows=len(table.index)) as record:
+                    table.to_csv(os.path.join(PATH, outfile_name), sep=sep)
+                    record["bytes"] = os.path.getsize(os.path.join(PATH, outfile_name))
 
-    print(f"\n{'-'*60}")
-    print(f"Finished. A total of {TABLES} tables were produced.")
+    say(f"\n{'-'*60}")
+    say(f"Finished. A total of {TABLES} tables were produced.", stage="writing", done=TABLES)
+
+    if gene_index is not None:
+        write_gene_index(gene_index, prefix=f"{prefix}_gene_index", PATH=PATH)
+
+    if report is not None:
+        report.save(os.path.join(PATH, f"{prefix}_report.json"))
+
+
+def write_partial_aggregates(partials, prefix="partial", PATH=PATH):
+
+    """
+    Writes every PartialAggregate of <partials> (what aggregate_all()
+    returns with partial=True) to its own .npz file, named like the
+    tables of write_all_aggregated(). They can be merged with the ones of
+    other directories with PartialAggregate.load() and merge(), or from
+    the command line with restring-reduce.
+
+    prefix    Output files start with this. Use a different one for each
+              shard of directories, when they are written in the same
+              place.
+
+    PATH      The directory where the files are written.
+
+    Returns: <list> of the files written.
+    """
+
+    written = []
+    for (way, k), partial in partials.items():
+        outfile_name = f"{prefix}_{'_'.join(way)}_{k}.npz"
+        partial.save(os.path.join(PATH, outfile_name))
+        written.append(os.path.join(PATH, outfile_name))
+
+    return written
+
+
+def write_gene_index(gene_index, prefix="gene_index", PATH=PATH):
+
+    """
+    Writes the GeneIndex <gene_index> next to the tables: the index itself
+    ({prefix}.npz, that GeneIndex.load() reads back) and its gene-centric
+    table ({prefix}.csv, see GeneIndex.table()).
+
+    Returns: <list> of the files written.
+    """
+
+    written = [os.path.join(PATH, f"{prefix}.npz"), os.path.join(PATH, f"{prefix}.csv")]
+    gene_index.save(written[0])
+    gene_index.table().to_csv(written[1], sep=sep)
+
+    return written
 
 
 def get_functional_enrichment(
     genes=None, species=None, caller_ID=session_ID,
     allow_pubmed=0, statistical_background=None, verbose=True,
-    string_api_url = "https://string-db.org/api" # defaults to latest STRING release
+    string_api_url = "https://string-db.org/api", # defaults to latest STRING release
+    progress=None, client=None,
 ):
 
     """
     Requests String functional enrichment via STRING API.
     Please see: https://string-db.org/help//api/
 
+    If a Progress is given as <progress>, the messages are posted to it
+    instead of being printed.
+
+    Queries go through <client>, an EnrichmentClient, that keeps the
+    connections to STRING open between them. If None, one client is
+    shared by all calls.
+
+    Busy or unreachable servers are asked again, with growing waits (see
+    EnrichmentClient). If STRING does not answer in the end, or replies
+    with an error, a StringAPIError is raised.
+
     Returns:
     ========
     pandas.core.frame.DataFrame: retrieved results
 
     """
 
-    def say(*args, **kwargs):
-        if verbose:
-            print(*args, **kwargs)
+    say = _sayer(verbose, progress)
 
     species_book = {
         "mouse": 10090,
@@ -624,49 +3546,38 @@ def get_functional_enrichment(
     if species is None:
         raise TypeError("Organism species must be provided. Mouse (10090)? Human (9606)?")
 
-    say(f"Querying STRING. Session ID: {caller_ID}, TaxID: {species}, {len(genes)} genes/proteins.")
+    say(
+        f"Querying STRING. Session ID: {caller_ID}, TaxID: {species}, {len(genes)} genes/proteins.",
+        stage="query", total=len(genes),
+    )
 
-    output_format = "tsv"
-    method = "enrichment"
-    request_url = "/".join([string_api_url, output_format, method])
+    if client is None:
+        client = default_client()
 
     if statistical_background is None:
         say("Running the analysis against a statistical",
             "background of the entire genome (default)."
             )
-
-        params = {
-        "identifiers" : "%0d".join(genes), # your proteins
-        "species" : species,               # species NCBI identifier 
-        "caller_identity" : caller_ID,     # your app name
-        "allow_pubmed": 0,                 # this just seems to be ignored
-        }
     else:
         say("Running the analysis against a statistical",
             "background of user-supplied terms."
             )
 
-        params = {
-        "identifiers" : "%0d".join(genes), # your proteins
-        "species" : species,               # species NCBI identifier 
-        "caller_identity" : caller_ID,     # your app name
-        "allow_pubmed": 0,                 # this just seems to be ignored
-        "background_string_identifiers": "%0d".join(statistical_background)
-        }
-
     t0 = time()
-    response = requests.post(request_url, data=params)
+    df = client.enrichment(
+        genes, species, caller_ID, statistical_background,
+        allow_pubmed=allow_pubmed, string_api_url=string_api_url,
+    )
     t1 = time()
 
-    say(f"STRING replied in {round((t1-t0)*1000, 2)} milliseconds.")
-
-    df = pd.read_csv(StringIO(response.text.strip()), sep="\t", index_col=0)
+    say(f"STRING replied in {round((t1-t0)*1000, 2)} milliseconds.", stage="query")
 
     return df
 
 
 def write_functional_enrichment_tables(df, databases="defaults", skip_empty=True,
-                                       prefix=None, verbose=True):
+                                       prefix=None, verbose=True, path=".",
+                                       sidecar=True, progress=None):
     """
     For each type of functional enrichment, this **writes** a table.
     
@@ -681,6 +3592,17 @@ def write_functional_enrichment_tables(df, databases="defaults", skip_empty=True
 
          If "all", then all possibile types of tables are produced.
 
+    path   The directory where tables are written. Defaults to the
+         current directory.
+
+    sidecar  If True, a binary copy of every table is written next to it
+         (same name, ending in SIDECAR_SUFFIX). Aggregating the tables
+         then loads the copy instead of parsing the text, as long as the
+         .tsv file is not changed.
+
+    progress  A Progress, where the messages are posted instead of being
+         printed.
+
 
     Returns:
     =======
@@ -688,9 +3610,7 @@ def write_functional_enrichment_tables(df, databases="defaults", skip_empty=True
     None
     """
 
-    def say(*args, **kwargs):
-        if verbose:
-            print(*args, **kwargs)
+    say = _sayer(verbose, progress)
 
     if databases != "all":
         if databases == "defaults":
@@ -701,7 +3621,7 @@ def write_functional_enrichment_tables(df, databases="defaults", skip_empty=True
 
             for x in wanted:
                 if x not in API_file_types:
-                    print(f"*warning*: unknown database {x}")
+                    say(f"*warning*: unknown database {x}")
                     wanted.pop(x)
             if len(x) == 0:
                 raise TypeError("No valid database provided.")
@@ -746,17 +3666,34 @@ def write_functional_enrichment_tables(df, databases="defaults", skip_empty=True
             "matching proteins in your network (labels)",
         ]
 
-        tempdf = tempdf.rename(columns=new_col_names)
-        tempdf = tempdf.set_index("#term ID")
-        tempdf = tempdf[new_col_order]
+        try:
+            tempdf = tempdf.rename(columns=new_col_names)
+            tempdf = tempdf.set_index("#term ID")
+            tempdf = tempdf[new_col_order]
+        except KeyError:
+            # STRING replied with an error, instead of the enrichment
+            if "message" in df.columns:
+                say("Something's wrong, and we received this response from STRING:")
+                say(df["message"])
+            raise
 
         if skip_empty:
             if len(tempdf.index) == 0:
-                say(f"*Notice*: skipping {tempname}: it's empty.")
+                say(f"*Notice*: skipping {tempname}: it's empty.", stage="writing", name=tempname)
                 continue
 
-        tempdf.to_csv(tempname, sep="\t")
-        say(f"Table written: {tempname}")
+        tempdf.to_csv(os.path.join(path, tempname), sep="\t")
+        say(f"Table written: {tempname}", stage="writing", name=os.path.join(path, tempname))
+
+        # the same columns _read_directory() looks for; the other kinds are
+        # never aggregated
+        if sidecar and term in header_table:
+            _write_sidecar(
+                os.path.join(path, tempname),
+                header_table[term]["ID"],
+                header_table[term]["score"],
+                header_table[term]["gene name"],
+            )
 
 
 def draw_clustermap(data, figsize=None, sort_values=None,
@@ -765,7 +3702,7 @@ def draw_clustermap(data, figsize=None, sort_values=None,
                     unwanted_terms=None, title=None, title_size=24,
                     savefig=False, outfile_name="aggregated results.png",
                     dpi=300, readable=False, return_table=False,
-                    savefigGUI=False, **kwargs
+                    savefigGUI=False, progress=None, **kwargs
     ):
     
     """
@@ -837,6 +3774,9 @@ def draw_clustermap(data, figsize=None, sort_values=None,
               internally to draw the heatmap (with all modifications applied).
               Returns: <seaborn.matrix.ClusterGrid>, <pandas.core.frame.DataFrame>
 
+    progress  A Progress, where the warnings are posted instead of being
+              printed.
+
     **kwargs    The drawing is performed by seaborn.clustermap(). All additional
               keyword arguments are passed directly to it, so that the final picture
               can be precisely tuned. More at:
@@ -844,6 +3784,8 @@ def draw_clustermap(data, figsize=None, sort_values=None,
 
     """
 
+    say = _sayer(True, progress)
+
     if isinstance(data, str):
         table = pd.read_csv(data, index_col=0)
     else:
@@ -862,7 +3804,7 @@ def draw_clustermap(data, figsize=None, sort_values=None,
             # the sign of zeroes
             table = table.replace({-0: 0})
     except TypeError:
-        print("*error* Check the table layout, something's not right.")
+        say("*error* Check the table layout, something's not right.")
         return table
 
     # custom column content --------
@@ -874,8 +3816,8 @@ def draw_clustermap(data, figsize=None, sort_values=None,
         try:
             table = table.reindex(custom_index)
         except NameError:
-            print(f"*error* Something went wrong with custom index: {custom_index}")
-            print("      Table index was NOT modified.")
+            say(f"*error* Something went wrong with custom index: {custom_index}")
+            say("      Table index was NOT modified.")
             pass
 
     if unwanted_terms is not None:
@@ -887,18 +3829,17 @@ def draw_clustermap(data, figsize=None, sort_values=None,
                     try:
                         table = table.drop(x, axis=0)
                     except:
-                        print(f"*warning* while processing unwanted_terms")
-                        print(f"*warning* Something went wrong with {x}")
+                        say(f"*warning* while processing unwanted_terms")
+                        say(f"*warning* Something went wrong with {x}")
         except:
-            print(f"*error* Something went wrong with unwanted terms: {unwanted_terms}")
-            print("         Table index was NOT modified as intended.")
+            say(f"*error* Something went wrong with unwanted terms: {unwanted_terms}")
+            say("         Table index was NOT modified as intended.")
 
 
     # we do this last, major modification of table content
     # TODO FIX: if NOT log transforming, this should be < pval_min
     if pval_min is not None:
-        bser = [any(table.loc[x, :] > pval_min) for x in table.index]
-        table = table.loc[bser,:]
+        table = table.loc[(table > pval_min).any(axis=1), :]
 
     # end of custom column content --------
 
@@ -1036,46 +3977,51 @@ class Aggregation:
     TODO: more doc here
     """
 
-    def __init__(self, working_directory=None, overwrite=False, verbose=True):
+    def __init__(self, working_directory=None, overwrite=False, verbose=True,
+                 progress=None, client=None):
 
+        # all paths are built from <working_directory>: the process current
+        # directory is never changed, so that more Aggregation objects
+        # can be run at the same time (for instance, in threads)
         if working_directory is None:
             self.working_directory = os.path.abspath(".")
             self._original_path = os.path.abspath(".")
         else:
             if isinstance(working_directory, str):
-                self.working_directory = working_directory
-                os.chdir(self.working_directory)
+                self.working_directory = os.path.abspath(working_directory)
             else:
                 raise TypeError(f"*Error* : unrecognized path {working_directory}")
 
         self.verbose = verbose
         self.overwrite = overwrite
+        # a Progress: if given, messages are posted to it instead of printed
+        self.progress = progress
+        # an EnrichmentClient: if None, the shared one is used
+        self.client = client
 
         self.say(f"Current working directory: {self.working_directory}")
         #self.show_params()
 
 
     def say(self, *args, **kwargs):
-        if self.verbose:
-            print(*args, **kwargs)
+        _sayer(self.verbose, self.progress)(*args, **kwargs)
 
 
     def setwd(self, stringlike):
 
         if os.path.exists(stringlike):
-            os.chdir(stringlike)
-            self.working_directory = stringlike
+            self.working_directory = os.path.abspath(stringlike)
             self.say(f"Working directory changed to:\n{self.working_directory}")
         else:
             self.say(f"Invalid path: {stringlike}")        
 
 
     def show_params(self):
-        print(f"Current working directory: {self.working_directory}")
+        _sayer(True, self.progress)(f"Current working directory: {self.working_directory}")
 
 
     def get_files(self, startswith=None, endswith=None, inside=None):
-        """retrieves all files in current path, then keeps or discards
+        """retrieves all files in the working directory, then keeps or discards
         them based on input parameters. Folders starting with "__" and "."
         are discarded
 
@@ -1103,8 +4049,11 @@ class Aggregation:
         <list>
         """
 
-        files = sorted(os.listdir("."))
-        files = [x for x in files if not os.path.isdir(x)]
+        files = sorted(os.listdir(self.working_directory))
+        files = [
+            x for x in files
+            if not os.path.isdir(os.path.join(self.working_directory, x))
+        ]
         files = [x for x in files if not x.startswith("__") and not x.startswith(".")]
 
         if startswith is not None:
@@ -1121,22 +4070,37 @@ class Aggregation:
 
 
     def get_dirs(self):
-        """retrieves all folders in current path, then keeps or discards
+        """retrieves all folders in the working directory, then keeps or discards
         them based on input parameters. Folders starting with "__" and "."
         are discarded
         """
 
-        dirs = sorted(os.listdir("."))
-        dirs = [x for x in dirs if os.path.isdir(x)]
-        dirs = [x for x in dirs if not x.startswith("__") and not x.startswith(".")]
+        dirs = get_dirs(self.working_directory)
         
         self._dirs = dirs
         return dirs
 
 
     def file_analysis(self, kind="csv", sep=sep, species="mouse",
-                      reverse_direction=False, query_wait_time=1,
+                      reverse_direction=False, query_wait_time=None, cache=False,
+                      workers=api_workers, gene_index=False,
         ):
+        """Queries STRING with the UP and DOWN genes of every file, and
+        aggregates the results.
+
+        Params:
+        =======
+        workers:  <int> STRING queries kept in flight at once (settings.api_workers);
+                  they are spaced by the rate limit of the client anyway
+                  (settings.api_rate)
+
+        query_wait_time: <float> or None; if given, also at least this many
+                  seconds between the start of two queries
+
+        gene_index: <bool>; if True, every gene of the tables is indexed while
+                  they are aggregated (see GeneIndex), and the index is written
+                  next to the tables (see write_gene_index())
+        """
 
         if not hasattr(self, "_files"):
             self.say(f"Retrieving the files in the current directory..")
@@ -1152,10 +4116,7 @@ class Aggregation:
 
         #here we go!
         t0 = time()
-        print("*DEBUG* Here we go!!!")
-        print("=" * 80, "\n")
-        print("=" * 80, "\n")
-        print("=" * 80, "\n")
+        jobs = []  # (folder, prefix, genes)
         for f in self._files:
             if any([f.endswith(x) for x in (".txt", ".csv", ".xls", ".tsv", ".doc", ".tdt")]):
                 extension = -4
@@ -1176,24 +4137,25 @@ class Aggregation:
             if os.path.exists(temppath):
                 if self.overwrite:
                     self.say(f"*Notice*: Path {f} exists, but we're going to overwrite it.\n")
-                    os.chdir(temppath)
                 else:
-                    print(f"*Error* : path '{temppath}' already exists, and overwrite='False'.")
+                    _sayer(True, self.progress)(
+                        f"*Error* : path '{temppath}' already exists, and overwrite='False'."
+                    )
                     return None
             else:
-                os.mkdir(folder_name)
-                os.chdir(temppath)
+                os.mkdir(temppath)
                 self.say(f"Now in: {temppath}")
 
             # we assume that the input files are tabular in nature.
             # first column: gene identifiers
             # second columns: fold change values
 
+            infile = os.path.join(self.working_directory, f)
             if kind == "csv":
-                tempdf = pd.read_csv(f"../{f}", index_col=0, sep=sep)
+                tempdf = pd.read_csv(infile, index_col=0, sep=sep)
                 self.say(f"Reading from: {f}")
             elif kind == "xls":
-                tempdf = pd.read_excel(f"../{f}", index_col=0)
+                tempdf = pd.read_excel(infile, index_col=0)
                 self.say(f"Reading from: {f}")
             else:
                 raise NotImplementedError(f"*Error*: can't handle: {kind}.")
@@ -1207,7 +4169,7 @@ class Aggregation:
                     err_message += f"First index element: '{tempdf.index[0]}'."
                 raise NotImplementedError(err_message)
             if rownumber == 0:
-                print(f"*Notice*: no genes to process in '{f}'.")
+                self.say(f"*Notice*: no genes to process in '{f}'.")
                 continue
 
             col = tempdf.columns[0]
@@ -1233,61 +4195,111 @@ class Aggregation:
                 up_gene_list   = list(tempdf[tempdf[col] < 0].index)
                 down_gene_list = list(tempdf[tempdf[col] > 0].index)
 
-            string_params = {
-                "species": species,
-                "caller_ID": session_ID,
-                "allow_pubmed": 0
-            }
+            jobs.append((temppath, "UP_", up_gene_list))
+            jobs.append((temppath, "DOWN_", down_gene_list))
+
+            # TODO: implement this analysis
+            #jobs.append((temppath, "ALL_", all_gene_list))
+
+        string_params = {
+            "species": species,
+            "caller_ID": session_ID,
+            "allow_pubmed": 0,
+            "progress": self.progress,
+            "client": self.client,
+        }
 
-            up_df = get_functional_enrichment(up_gene_list, **string_params)
-            sleep(query_wait_time)
-            write_functional_enrichment_tables(up_df, prefix="UP_")
+        # the same genes from different files are asked once, and written to
+        # all their folders: species and background are the same for the run
+        groups = coalesce(jobs, lambda job: frozenset(job[2]))
+        self.say(f"{len(jobs)} queries to STRING, {len(groups)} of them different.")
 
-            down_df = get_functional_enrichment(down_gene_list, **string_params) 
-            sleep(query_wait_time)
-            write_functional_enrichment_tables(down_df, prefix="DOWN_")
+        def fetch(group):
+            return get_functional_enrichment(group[0][2], **string_params)
 
-            # TODO: implement this analysis
-            #all_df = get_functional_enrichment(all_gene_list, **string_params)
-            #sleep(query_wait_time)
-            #write_functional_enrichment_tables(all_df, prefix="ALL_")
+        client = self.client if self.client is not None else default_client()
+        reply_cache = client.cache
+        cached = (0, 0) if reply_cache is None else (reply_cache.hits, reply_cache.misses)
+
+        # queries STRING does not answer are tried again at the end, and if
+        # they still fail, the others go on without them
+        failed = []
 
-            self.say()
-            os.chdir(self.working_directory)
+        limiter = None
+        if query_wait_time:
+            limiter = TokenBucket(rate=1 / query_wait_time, burst=1)
+
+        # the queries run concurrently, the tables are written here as they come
+        for group, df in fetch_all(
+            groups, fetch, workers=workers, limiter=limiter, failed=failed,
+            backoff=client.backoff,
+        ):
+            for temppath, prefix, _ in group:
+                write_functional_enrichment_tables(
+                    df, prefix=prefix, path=temppath, progress=self.progress
+                )
 
         t1 = time()
         self.say(f"{'='*80}\nFinished making functional enrichment tables.")
         self.say(f"{round(t1-t0, 2)} seconds elapsed.")
+        if reply_cache is not None:
+            self.say(
+                f"STRING cache: {reply_cache.hits - cached[0]} hits, "
+                f"{reply_cache.misses - cached[1]} misses."
+            )
+        if len(failed) > 0:
+            say = _sayer(True, self.progress)
+            say(f"*Error*: STRING did not answer {len(failed)} queries, these tables are missing:")
+            for group, error in failed:
+                for temppath, prefix, _ in group:
+                    say(f"{os.path.join(temppath, prefix)}enrichment.*.tsv: {error}")
 
         #now automatically running the aggregation of functional enrichment
 
         self.say(f"Getting directories to process.")
-        self.say(f"*Python*: dirs = get_dirs()")
-        dirs = get_dirs()
+        self.say(f"*Python*: dirs = get_dirs(working_directory)")
+        dirs = get_dirs(self.working_directory)
         produced_tables = []
 
+        # every String file is read once, for all the kinds
+        index = GeneIndex() if gene_index else None
+        self.say(
+            f"*Python*: aggregated = aggregate_all(dirs, ways=[['UP', 'DOWN']], PATH=working_directory, cache={cache}, lazy=True"
+            + (", gene_index=index)" if index is not None else ")")
+        )
+        aggregated = aggregate_all(
+            dirs, ways=[["UP", "DOWN"]], PATH=self.working_directory, cache=cache,
+            progress=self.progress, lazy=True, gene_index=index,
+        )
+
         for term in file_types: # these are legit and recognized by the other functions
 
             self.say(f"\nAggregating data for: {term}")
             self.say(f"{'='*35}")
 
-            self.say(f"*Python*: db = aggregate_results(dirs, kind='{term}')")
-            db = aggregate_results(dirs, kind=term)
+            self.say(f"*Python*: db = aggregated[('UP', 'DOWN'), '{term}']")
+            db = aggregated[("UP", "DOWN"), term]
 
-            self.say(f"*Python*: tableize_aggregated(db)")
-            df = tableize_aggregated(db)
+            self.say(f"*Python*: df = db.results()")
+            df = db.results()
             outfile_results_name = f"{term}_results.csv"
             self.say(f"*Python*: df.to_csv('{outfile_results_name}')")
-            df.to_csv(outfile_results_name)
+            df.to_csv(os.path.join(self.working_directory, outfile_results_name))
             produced_tables.append(outfile_results_name)
 
-            self.say(f"*Python*: res = summary(db)")
-            res = summary(db)
+            self.say(f"*Python*: res = db.summary()")
+            res = db.summary()
             outfile_summary_name = f"{term}_summary.csv"
             self.say(f"*Python*: res.to_csv('{outfile_summary_name}')")
-            res.to_csv(outfile_summary_name)
+            res.to_csv(os.path.join(self.working_directory, outfile_summary_name))
             produced_tables.append(outfile_summary_name)
 
+        if index is not None:
+            # which terms and conditions every gene was found in
+            self.say(f"\n*Python*: write_gene_index(index, PATH=working_directory)")
+            for name in write_gene_index(index, PATH=self.working_directory):
+                produced_tables.append(os.path.basename(name))
+
         self.say(f"\n{'='*80}\nFinished aggregating all terms. Tables produced:")
         for name in sorted(produced_tables):
             self.say(name)
@@ -1296,7 +4308,7 @@ class Aggregation:
 # ======================= advanced API features =========================
 
 # def remap_identifiers(listlike, url="https://string-db.org/api",
-#                       SPECIES=10090, session_ID="dummy session",
+#                       SPECIES=10090, session_ID="dummy session", client=None,
 #     ):
 #     """
 #     From STRING doc:
@@ -1324,31 +4336,12 @@ class Aggregation:
 #     except AssertionError:
 #         return None
     
-#     string_api_url = url
-#     output_format = "tsv-no-header"
-#     method = "get_string_ids"
-    
-#     params = {
-#     "identifiers" : "\r".join(listlike), # your protein list
-#     "species" : SPECIES,
-#     "limit" : 1, # only one (best) identifier per input protein
-#     "echo_query" : 1, # see your input identifiers in the output
-#     "caller_identity" : session_ID,
-#     }
-        
-#     request_url = "/".join([string_api_url, output_format, method])
-#     results = requests.post(request_url, data=params)
-    
-#     translated = []
-#     for line in results.text.strip().split("\n"):
-#         l = line.split("\t")
-#         #input_identifier, string_identifier = l[0], l[2]
-#         #print("Input:", input_identifier, "STRING:", string_identifier, sep="\t")
-#         translated.append(l[2])
-    
-#     return translated
+#     if client is None:
+#         client = default_client()
+#
+#     return client.string_ids(listlike, SPECIES, session_ID, string_api_url=url)
 
 def remap_identifiers(listlike, url="https://string-db.org/api",
-                      SPECIES=10090, session_ID="dummy session",
+                      SPECIES=10090, session_ID="dummy session", client=None,
     ):
     return listlike
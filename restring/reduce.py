@@ -0,0 +1,113 @@
+"""restring-reduce: merges the partial aggregates of many shards of
+directories (see aggregate_all(..., partial=True) and
+write_partial_aggregates()) and writes the final results and summary
+tables, as write_all_aggregated() and write_all_summarized() do.
+
+    restring-reduce -o results node1/partial_*.npz node2/partial_*.npz
+"""
+
+import argparse
+import os
+from functools import reduce
+
+from .gears import (
+    PartialAggregate,
+    write_all_aggregated,
+    write_all_summarized,
+    write_partial_aggregates,
+)
+
+
+def merge_partials(files):
+    """Loads the partial aggregates in <files>, and merges the ones of the
+    same way and kind, in the order they are given.
+
+    Returns: {(way, kind): PartialAggregate}
+    """
+
+    grouped = {}
+    for file in files:
+        partial = PartialAggregate.load(file)
+        if partial.kind is None or partial.way is None:
+            raise ValueError(f"{file}: the partial aggregate has no kind or way.")
+        grouped.setdefault((partial.way, partial.kind), []).append(partial)
+
+    return {
+        key: reduce(lambda a, b: a.merge(b), partials)
+        for key, partials in grouped.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="restring-reduce",
+        description="Merges restring partial aggregates (.npz) of different "
+        "shards of directories, and writes the aggregated and summary tables.",
+    )
+    parser.add_argument("files", nargs="+", help="partial aggregate files (.npz)")
+    parser.add_argument(
+        "-o", "--output", default=".",
+        help="directory where the tables are written (default: current directory)"
+    )
+    parser.add_argument(
+        "--aggregated-prefix", default="aggregated",
+        help="prefix of the results tables (default: aggregated)"
+    )
+    parser.add_argument(
+        "--summary-prefix", default="summary",
+        help="prefix of the summary tables (default: summary)"
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=None,
+        help="only keep this many terms with the best score, for every way and kind"
+    )
+    parser.add_argument(
+        "--max-fdr", type=float, default=None,
+        help="only keep the terms whose best score is at most this"
+    )
+    parser.add_argument(
+        "--partial-prefix", default=None,
+        help="also write the merged partial aggregates, with this prefix, "
+        "so that they can be merged again"
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    merged = merge_partials(args.files)
+
+    ways = []
+    for way, k in merged:
+        if list(way) not in ways:
+            ways.append(list(way))
+    kinds = []
+    for way, k in merged:
+        if k not in kinds:
+            kinds.append(k)
+
+    aggregated = {}
+    for way in ways:
+        for k in kinds:
+            partial = merged.get((tuple(way), k))
+            if partial is None:
+                aggregated[tuple(way), k] = {}
+            else:
+                # tables are built straight from the merged arrays
+                aggregated[tuple(way), k] = partial.result(args.top_k, args.max_fdr)
+
+    write_all_aggregated(
+        ways=ways, kind=kinds, prefix=args.aggregated_prefix,
+        aggregated=aggregated, PATH=args.output
+    )
+    write_all_summarized(
+        ways=ways, kind=kinds, prefix=args.summary_prefix,
+        aggregated=aggregated, PATH=args.output
+    )
+
+    if args.partial_prefix is not None:
+        write_partial_aggregates(merged, prefix=args.partial_prefix, PATH=args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,12 @@ from tkinter.scrolledtext import ScrolledText
 import webbrowser
 import re
 import os
+import threading
 from os.path import isdir
 from io import StringIO
 import pandas as pd
 from math import log
-from glob import glob
+from glob import glob, escape
 import requests
 from random import choice
 from time import time, sleep
@@ -23,6 +24,7 @@ from .gears import (
     manzlog,
     get_dirs,
     aggregate_results,
+    aggregate_all,
     tableize_aggregated,
     summary,
     write_all_aggregated,
@@ -37,6 +39,13 @@ from .gears import (
     draw_clustermap,
     draw_bubbleplot,
     Aggregation,
+    Progress,
+    GeneIndex,
+    EnrichmentClient,
+    TokenBucket,
+    fetch_all,
+    coalesce,
+    write_gene_index,
 
     # String API
     session_ID,
@@ -52,7 +61,8 @@ from .settings import (
     API_file_types,
     header_table, 
     sep,
-    PATH
+    PATH,
+    api_workers,
 )
 
 from . import __version__
@@ -1409,23 +1419,47 @@ ANALYSIS_TYPE = ["UP", "DOWN"]
 STRING_API_URL = "https://string-db.org/api" # defaults to the latest one
 def restring_gui():
 
-    def say(*args, sep=" ", end="\n"):
+    # messages are not written to the text wall right away: they are posted
+    # to <progress>, and shown in one go at most every progress.interval
+    # seconds. Redrawing Tk for every line is way slower than the analysis.
+    def show_progress():
+        events = progress.drain()
+        if len(events) == 0:
+            return
         output_window_text.configure(state='normal')
-
-        if len(args) > 1:
-            for arg in args[:-1]:
-                output_window_text.insert(tk.END, arg + sep)
-            output_window_text.insert(tk.END, args[-1] + end)
-        elif len(args) == 1:
-            output_window_text.insert(tk.END, args[0] + end)
-        elif len(args) == 0:
-            output_window_text.insert(tk.END, end)
-        
+        output_window_text.insert(
+            tk.END, "".join(event.message + event.end for event in events)
+        )
         output_window_text.configure(state='disabled')
         output_window_text.see(tk.END)
+
+
+    # called while the analysis runs (see Progress): also keeps the window alive.
+    # Tk can only be touched from the main thread: what the STRING query
+    # threads post waits there for the next call
+    def flush_progress():
+        if threading.current_thread() is not threading.main_thread():
+            return
+        show_progress()
         root.update()
 
 
+    # picks up what is left, and what other threads post
+    def poll_progress():
+        show_progress()
+        root.after(int(progress.interval * 1000), poll_progress)
+
+
+    progress = Progress(callback=flush_progress)
+
+    # all the queries to STRING reuse the same connections
+    client = EnrichmentClient()
+
+
+    def say(*args, sep=" ", end="\n"):
+        progress.post(sep.join(str(x) for x in args), end=end)
+
+
     def dummy_command():
         say("*debug*: A dummy command was issued.")
 
@@ -1468,15 +1502,9 @@ def restring_gui():
         )
 
 
-    # TODO: make generic. this just works for <output_window_text>
-    # TODO: this looks a lot like say()
-    # TODO: replace this with say??? TODO TODO TODO and see if that works
+    # like say(), but <message> is written as it is
     def write_to_textwall(message="write_to_textwall(): unspecified message\n"):
-        output_window_text.configure(state='normal')
-        output_window_text.insert(tk.END, message)
-        output_window_text.configure(state='disabled')
-        output_window_text.see(tk.END)
-        output_window.update()
+        progress.post(message, end="")
 
 
     def download_sample_data():
@@ -1495,388 +1523,6 @@ def restring_gui():
             return None
 
 
-    # modified version to write stuff to the GUI
-    # TODO: move this over to guigears
-    def get_functional_enrichmentGUI(genes=None, species=None, caller_ID=session_ID,
-                                  allow_pubmed=0, verbose=True,
-                                  string_api_url = "https://string-db.org/api"):
-
-        """
-        Requests String functional enrichment via STRING API.
-        Please see: https://string-db.org/help//api/
-
-        Returns:
-        ========
-        pandas.core.frame.DataFrame: retrieved results
-
-        """
-
-        species_book = {
-            "mouse": 10090,
-            "mus musculus": 10090,
-            "10090": 10090,
-            "human": 9606,
-            "homo sapiens": 9606,
-            "9606": 9606,
-        }
-
-        if genes is None:
-            raise TypeError("A list of gene/protein identifiers is required.")
-
-        if isinstance(species, str):
-            species = species_book.get(species, None)
-
-        if species is None:
-            raise TypeError("Organism species must be provided. Mouse (10090)? Human (9606)?")
-
-        say(f"Querying STRING. Session ID: {caller_ID}, TaxID: {species}, {len(genes)} genes/proteins.")
-
-        output_format = "tsv"
-        method = "enrichment"
-        request_url = "/".join([string_api_url, output_format, method])
-
-        # TODO: sposta la traduzione immediatamente on load
-        global statistical_background
-
-
-        # sometimes the <identifiers> response fails for some
-        # reasons (most likely, bad server response).
-        # Trying to calculate them, or printing all available
-        # info for debugging.
-        try:
-            identifiers_ = "%0d".join(genes)
-        except:
-            print("Troubles with the parsing of identifiers.")
-            print(f"<genes> content:\n{genes}\n")
-            try:
-                print(f"<identifiers_> content:\n{identifiers_}\n")
-            except:
-                print(f"Could not process to get <identifiers_> right.")
-            print("Reraising the full exception:")
-            raise
-
-        if statistical_background is None:
-            say("Running the analysis against a statistical",
-                "background of the entire genome (default)."
-                )
-
-            params = {
-            "identifiers" : identifiers_,      # your proteins
-            "species" : species,               # species NCBI identifier 
-            "caller_identity" : caller_ID,     # your app name
-            "allow_pubmed": 0,                 # this just seems to be ignored
-            }
-        else:
-            say("Running the analysis against a statistical",
-                "background of user-supplied terms."
-                )
-
-            params = {
-            "identifiers" : identifiers_,      # your proteins
-            "species" : species,               # species NCBI identifier 
-            "caller_identity" : caller_ID,     # your app name
-            "allow_pubmed": 0,                 # this just seems to be ignored
-            "background_string_identifiers": "%0d".join(statistical_background)
-            }
-
-
-        t0 = time()
-        response = requests.post(request_url, data=params)
-        t1 = time()
-
-        say(f"STRING replied in {round((t1-t0) * 1000, 2)} milliseconds.")
-
-        df = pd.read_csv(StringIO(response.text.strip()), sep="\t", index_col=0)
-
-        return df
-
-
-    # modified version to write to the GUI
-    # TODO: move this over to guigears
-    def write_functional_enrichment_tablesGUI(df, databases="defaults", skip_empty=True,
-                                           prefix=None, verbose=True):
-        """
-        For each type of functional enrichment, this **writes** a table.
-        
-        Params:
-        =======
-
-        databases   A <list> of <str> of wanted functional enrichments, as
-             defined in settings.API_file_types.
-
-             If "defaults", then only settings.file_types databases are produced
-             (Component, Function, KEGG, Process, RCTM).
-
-             If "all", then all possibile types of tables are produced.
-
-
-        Returns:
-        =======
-
-        None
-        """
-
-        if databases != "all":
-            if databases == "defaults":
-                wanted = file_types
-
-            elif isinstance(databases, (list, tuple)) and len(databases) != 0:
-                wanted = databases
-
-                for x in wanted:
-                    if x not in API_file_types:
-                        say(f"*warning*: unknown database {x}")
-                        wanted.pop(x)
-                if len(x) == 0:
-                    raise TypeError("No valid database provided.")
-
-            else:
-                raise TypeError("A list of wanted databases is required")
-        else:
-            wanted = API_file_types
-
-        for term in wanted: # term like "KEGG", "Function", ...
-            tempindex = df.index == term
-            tempdf = df.loc[tempindex]
-            tempname = f"enrichment.{term}.tsv"
-
-            if prefix is not None:
-                tempname = prefix + tempname
-
-            # now we need to maquillage this table into the same layout of
-            # tables that users retrieve via the web interface (it's not the same)
-
-            new_col_names = {
-                # old : new
-                # category: None,
-                "term": "#term ID",
-                "description": "term description",
-                "number_of_genes": "observed gene count",
-                "number_of_genes_in_background": "background gene count",
-                # "ncbiTaxonId": None,
-                "inputGenes": "matching proteins in your network (labels)",  # guesswork
-                "preferredNames": "matching proteins in your network (IDs)", # guesswork
-                # "p_value": None,
-                "fdr": "false discovery rate",
-            }
-
-            new_col_order = [
-                #"#term ID", #this is the index now
-                "term description",
-                "observed gene count",
-                "background gene count",
-                "false discovery rate",
-                "matching proteins in your network (IDs)",
-                "matching proteins in your network (labels)",
-            ]
-
-            try:
-                tempdf = tempdf.rename(columns=new_col_names)
-                tempdf = tempdf.set_index("#term ID")
-                tempdf = tempdf[new_col_order]
-            except:
-                print("**debug: df\n",
-                    df,
-                    len(tempdf),
-                    df.columns,
-                    type(df),
-                    df.__repr__(),
-                    dir(df),
-                    sep="\n", end="-"*20)
-                print("**debug: tempdf\n", tempdf)
-
-                if "message" in df.columns:
-                    say("Something's wrong, and we received this response from STRING:")
-                    say(df["message"])
-                raise
-
-            if skip_empty:
-                if len(tempdf.index) == 0:
-                    say(f"*Notice*: skipping {tempname}: it's empty.")
-                    continue
-
-            tempdf.to_csv(tempname, sep="\t")
-            say(f"Table written: {tempname}")
-
-
-    # modified version to write to the GUI
-    # TODO: move this over to guigears
-    def aggregate_resultsGUI(
-        directories,
-        kind="KEGG",
-        directions=["UP", "DOWN"],
-        verbose=True,
-
-        # -- settings.py --
-
-        file_types=file_types, 
-        PATH=PATH,
-        header_table=header_table,
-    ):
-        
-        """
-        Walks the given <directories> list, and reads the String .tsv files of
-        defined <kind>.
-
-        Params:
-        =======
-        directories: <list> of directories where to look for String files
-
-        kind:    <str> Defines the String filetype to process. Kinds defined in
-                 settings.file_types
-
-        directions: <list> contaning the up- or down-regulated genes in a comparison.
-                 Info is retrieved from either UP and/or DOWN lists, *or*
-                 from the list of ALL genes together.
-                 * Prerequisite *: generating files form String with UP and/or DOWN regulated
-                 genes separately.
-
-        verbose: <bool>; turns verbose mode on or off
-
-
-        Returns: <dict>
-        ========
-        
-        Returned dict structure:
-        ========================
-        
-        dictlike   keys      keys(2)
-        {bestof} - {term1} - "exp condition" : <float>
-                             "exp condition2": <float>
-                             "hightes pval"  : <float>
-                 - {term2} - ...
-                 
-        Call tableize_aggregated() on this dict to build a table
-        """
-        
-        os.chdir(PATH)
-        
-        say("Start walking the directory structure.\n")
-        say(f"Parameters\n{'-'*10}\nfolders: {len(directories)}\nkind={kind}\ndirections={directions}\n")
-        
-        PROCESSED_DIRS = 0
-        PROCESSED_FILES = 0
-        
-        if not isinstance(directions, list):
-            try:
-                # supplied a string? check if that's a valid direction
-                temp = directions
-                directions = []
-                directions.append(temp)
-                if directions[0] not in ["UP", "DOWN"]:
-                    raise TypeError
-            except:
-                say(f"Problems with param directions: {directions} of type {type(directions)}")
-                say("directions must either be ['UP, DOWN'] 'UP', 'DOWN' or 'ALL'.")
-                raise
-        
-        if kind not in file_types:
-            raise TypeError(f"STRING analysis type must be one of these:\n{file_types}")
-        
-        bestof = {}
-        
-        # ID : the column name of the wanted name (process, KEGG, ..)
-        # score: the column name or the wanted score (likely the false discovery rate or pval)
-        # TERM_ID: the actual term to be retrieved
-        # SCORE: the actual float score
-        # gene_names: the column where the genes per term are stored
-        
-        # picking the header handles form settings.header_table
-        # as of now, this is superfluous as all tables share the same layout. Should
-        # this change in the future, just update settings.header_table
-        ID, score, gene_names = header_table[kind].values()
-                        
-        # start walking the directories
-        # =============================
-        for d in directories:
-            PROCESSED_DIRS += 1
-            say(f"Processing directory: {d}")
-            os.chdir(d)
-            
-            files = glob("*enrichment."+kind+".tsv")
-
-            if len(files) > 0:
-                for file in files: # either UP and/or DOWN; or ALL
-                    
-                    if file[:2] in [x[:2] for x in directions]:
-                        PROCESSED_FILES += 1
-                        say(f"\tProcessing file {file}")
-
-                        df = pd.read_csv(file, sep="\t", index_col=ID) # sep HAS TO BE "\t"
-                        for TERM_ID in df.index:
-                            # we are adding the first key to <bestof>.
-                            # this key is the retrieved term.
-                            # in this sub-dict, the first keys to be added
-                            # are the following, then followed by all
-                            # <d> (directory names, == experimental groups)
-                            #
-                            #
-                            # bestof -- TERM -- "highest score" <float>
-                            #               --- "genes" <set>
-                            #               --- "common_temp" <dict>
-                            #               --- "directory_1" <float>
-                            #               --- "directory 2" <float>
-                            #               --- ...
-                            #        -- TERM2 - ...
-                            #
-                            bestof.setdefault(TERM_ID, {})
-                            bestof[TERM_ID].setdefault("highest score", 1)
-                            bestof[TERM_ID].setdefault("genes", set())
-                            bestof[TERM_ID].setdefault("common_temp", dict())
-                            
-                            # adding a key (d - the directory) to the sub dict
-                            # storing the pvalue of that term, for future heatmap
-                            SCORE = df.loc[TERM_ID, score]
-                            bestof[TERM_ID][d] = SCORE
-                            if bestof[TERM_ID]["highest score"] > SCORE:
-                                bestof[TERM_ID]["highest score"] = SCORE
-                            
-                            GENES = df.loc[TERM_ID, gene_names]
-                            GENES = GENES.split(",")
-                            bestof[TERM_ID]["genes"].update(set(GENES))
-                            
-                            # things get tricky. I'm looping over the directories,
-                            # not terms. Now I have to store all genes for every
-                            # directory, then only at the end I have to find
-                            # the common elements
-                            GENES = df.loc[TERM_ID, gene_names]
-                            GENES = GENES.split(",")
-                            bestof[TERM_ID]["common_temp"].setdefault(d, set(GENES))
-            
-            os.chdir("..")
-        
-        # final thing to do: loop over TERM_ID (bestof keys) and find the common genes,
-        # then deleting individual sets
-        
-        for k in bestof.keys():
-            curr = bestof[k]["common_temp"] # <dict>
-            conditions = list(curr.keys())
-            
-            first_key = conditions.pop() # <set>
-            first_set = curr[first_key]
-            
-            if len(conditions) > 0:
-                for other_keys in conditions:
-                    first_set = first_set.intersection(curr[other_keys])
-
-                # now first_set contains all genes that are commonly picked up in all conditions
-                if len(first_set) == 0:
-                    first_set = set(list(["No common gene"]))
-                
-                
-                del bestof[k]["common_temp"]
-                bestof[k]["common"] = first_set
-            else: # there is just one condition
-                del bestof[k]["common_temp"]
-                bestof[k]["common"] = set(list(["n/a (just one condition)"]))
-            
-            
-        say(f"\nProcessed {PROCESSED_DIRS} directories and {PROCESSED_FILES} files.")
-        say(f"Found a total of {len(bestof)} {kind} elements.")
-        
-        return bestof
-
-
     # modified version to fit in the GUI
     # TODO: move this over to guigears
     class AggregationGUI:
@@ -1895,30 +1541,34 @@ def restring_gui():
             self.overwrite = overwrite
 
 
-        #TODO: replace with safer *args version
-        def say(self, message):
-            message = message + "\n"
-            output_window_text.configure(state='normal')
-            output_window_text.insert(tk.END, message)
-            output_window_text.configure(state='disabled')
-            output_window_text.see(tk.END)
-            root.update()
+        def say(self, *args, **kwargs):
+            say(*args, **kwargs)
 
 
         def file_analysis(
             self,
             #species="mouse",  # now there's a global SPECIES
             reverse_direction=False,
-            query_wait_time=1,
+            query_wait_time=None,
+            workers=api_workers,
+            gene_index=False,
         ):
-
+            """<workers> STRING queries are kept in flight at once, spaced by
+            the rate limit of <client>. If <query_wait_time> is given, there
+            are also at least that many seconds between the start of two
+            queries. If <gene_index> is True, the genes of all the tables
+            are indexed too (see GeneIndex), and the index is written next
+            to the tables.
+            """
 
             #here we go!
             t0 = time()
 
-            os.chdir(self.working_directory)
+            # the current directory is never changed: all paths are built
+            # from self.working_directory
             # TODO: now this stuff of getting the extension may be unnecessary
             # as we have the full path for all files
+            jobs = []  # (folder, prefix, genes)
             for f in self._files:
                 if f.endswith(".xlsx"):
                     kind = "xls"
@@ -1958,13 +1608,11 @@ def restring_gui():
                 if os.path.exists(temppath):
                     if self.overwrite:
                         self.say(f"*Notice*: Path {f} exists, but we're going to overwrite it.\n")
-                        os.chdir(temppath)
                     else:
                         self.say(f"*Error* : path '{temppath}' already exists, and overwrite='False'.")
                         return None
                 else:
-                    os.mkdir(folder_name)
-                    os.chdir(temppath)
+                    os.mkdir(temppath)
                     self.say(f"Now in: {temppath}")
 
                 # we assume that the input files are tabular in nature.
@@ -1977,7 +1625,7 @@ def restring_gui():
                     tempdf = pd.read_csv(f"{f}", index_col=0, sep=sep)
                     self.say(f"Reading from: {f}")
                 elif kind == "xls":
-                    tempdf = pd.read_excel(f"../{f}", index_col=0)
+                    tempdf = pd.read_excel(f"{f}", index_col=0)
                     self.say(f"Reading from: {f}")
                 else:
                     raise NotImplementedError(f"*Error*: can't handle: {kind}.")
@@ -2024,70 +1672,120 @@ def restring_gui():
                     up_gene_list   = list(tempdf[tempdf[col] < 0].index.dropna())
                     down_gene_list = list(tempdf[tempdf[col] > 0].index.dropna())
 
-                string_params = {
-                    "species": SPECIES,
-                    "caller_ID": session_ID,
-                    "allow_pubmed": 0,
-                    "string_api_url": STRING_API_URL,
-                }
-
                 if "UP" in ANALYSIS_TYPE:
-                    up_df = get_functional_enrichmentGUI(up_gene_list, **string_params)
-                    sleep(query_wait_time)
-                    write_functional_enrichment_tablesGUI(up_df, prefix="UP_")
+                    jobs.append((temppath, "UP_", up_gene_list))
 
                 if "DOWN" in ANALYSIS_TYPE:
-                    down_df = get_functional_enrichmentGUI(down_gene_list, **string_params) 
-                    sleep(query_wait_time)
-                    write_functional_enrichment_tablesGUI(down_df, prefix="DOWN_")
+                    jobs.append((temppath, "DOWN_", down_gene_list))
 
                 if "ALL" in ANALYSIS_TYPE:  #not checking if unique: managed by GUI
-                    all_df = get_functional_enrichmentGUI(all_gene_list, **string_params)
-                    sleep(query_wait_time)
-                    write_functional_enrichment_tablesGUI(all_df, prefix="ALL_")
+                    jobs.append((temppath, "ALL_", all_gene_list))
+
+            string_params = {
+                "species": SPECIES,
+                "caller_ID": session_ID,
+                "allow_pubmed": 0,
+                "statistical_background": statistical_background,
+                "string_api_url": STRING_API_URL,
+                "progress": progress,
+                "client": client,
+            }
 
-                self.say("")
-                os.chdir(self.working_directory)
+            # the same genes from different files are asked once, and written to
+            # all their folders: species and background are the same for the run
+            groups = coalesce(jobs, lambda job: frozenset(job[2]))
+            self.say(f"{len(jobs)} queries to STRING, {len(groups)} of them different.")
+
+            def fetch(group):
+                return get_functional_enrichment(group[0][2], **string_params)
+
+            reply_cache = client.cache
+            cached = (0, 0) if reply_cache is None else (reply_cache.hits, reply_cache.misses)
+
+            # queries STRING does not answer are tried again at the end, and if
+            # they still fail, the others go on without them
+            failed = []
+
+            limiter = None
+            if query_wait_time:
+                limiter = TokenBucket(rate=1 / query_wait_time, burst=1)
+
+            # the queries run in other threads, the tables are written here
+            # as they come, while the window is kept alive
+            for group, df in fetch_all(
+                groups, fetch, workers=workers, limiter=limiter,
+                idle=flush_progress, interval=progress.interval, failed=failed,
+                backoff=client.backoff,
+            ):
+                for temppath, prefix, _ in group:
+                    write_functional_enrichment_tables(
+                        df, prefix=prefix, path=temppath, progress=progress
+                    )
 
             t1 = time()
             self.say(f"{'='*80}\nFinished making functional enrichment tables.")
             self.say(f"{round(t1-t0, 2)} seconds elapsed.")
+            if reply_cache is not None:
+                self.say(
+                    f"STRING cache: {reply_cache.hits - cached[0]} hits, "
+                    f"{reply_cache.misses - cached[1]} misses."
+                )
+            if len(failed) > 0:
+                self.say(f"*Error*: STRING did not answer {len(failed)} queries, these tables are missing:")
+                for group, error in failed:
+                    for temppath, prefix, _ in group:
+                        self.say(f"{os.path.join(temppath, prefix)}enrichment.*.tsv: {error}")
 
             #now automatically running the aggregation of functional enrichment
 
             self.say(f"Getting directories to process.")
-            self.say(f"*Python*: dirs = get_dirs()")
-            dirs = get_dirs()
+            self.say(f"*Python*: dirs = get_dirs(working_directory)")
+            dirs = get_dirs(self.working_directory)
             produced_tables = []
 
+            # every String file is read once, for all the kinds
+            index = GeneIndex() if gene_index else None
+            self.say(
+                f"*Python*: aggregated = aggregate_all(dirs, ways=[{ANALYSIS_TYPE}], lazy=True"
+                + (", gene_index=index)" if index is not None else ")")
+            )
+            aggregated = aggregate_all(
+                dirs,
+                ways=[ANALYSIS_TYPE],
+                PATH=self.working_directory,
+                progress=progress,
+                lazy=True,
+                gene_index=index,
+            )
+
             for term in file_types: # these are legit and recognized by the other functions
                 
                 self.say(f"\nAggregating data for: {term}")
                 self.say(f"{'='*35}")
 
-                self.say(f"*Python*: db = aggregate_results(dirs, kind='{term}')")
-                #db = aggregate_resultsGUI(dirs, kind=term, PATH=self.working_directory)
-                db = aggregate_resultsGUI(
-                    dirs,
-                    kind=term,
-                    PATH=self.working_directory,
-                    directions=ANALYSIS_TYPE,
-                )
+                self.say(f"*Python*: db = aggregated[{tuple(ANALYSIS_TYPE)}, '{term}']")
+                db = aggregated[tuple(ANALYSIS_TYPE), term]
 
-                self.say(f"*Python*: tableize_aggregated(db)")
-                df = tableize_aggregated(db)
+                self.say(f"*Python*: df = db.results()")
+                df = db.results()
                 outfile_results_name = f"{term}_results.tsv"
                 self.say(f"*Python*: df.to_csv('{outfile_results_name}')")
-                df.to_csv(outfile_results_name, sep="\t")
+                df.to_csv(os.path.join(self.working_directory, outfile_results_name), sep="\t")
                 produced_tables.append(outfile_results_name)
 
-                self.say(f"*Python*: res = summary(db)")
-                res = summary(db)
+                self.say(f"*Python*: res = db.summary()")
+                res = db.summary()
                 outfile_summary_name = f"{term}_summary.tsv"
                 self.say(f"*Python*: res.to_csv('{outfile_summary_name}')")
-                res.to_csv(outfile_summary_name, sep="\t")
+                res.to_csv(os.path.join(self.working_directory, outfile_summary_name), sep="\t")
                 produced_tables.append(outfile_summary_name)
 
+            if index is not None:
+                # which terms and conditions every gene was found in
+                self.say(f"\n*Python*: write_gene_index(index, PATH=working_directory)")
+                for name in write_gene_index(index, PATH=self.working_directory):
+                    produced_tables.append(os.path.basename(name))
+
             self.say(f"\n{'='*80}\nFinished aggregating all terms. Tables produced:")
             for name in sorted(produced_tables):
                 self.say(name)
@@ -2198,7 +1896,8 @@ def restring_gui():
             list(df[df.columns[0]]),
             url=STRING_API_URL,
             SPECIES=SPECIES,
-            session_ID=session_ID
+            session_ID=session_ID,
+            client=client,
             )
 
         if statistical_background is None:
@@ -2460,6 +2159,7 @@ choose:\n\nFile > Download sample data"
         write_to_textwall("Aggregation started.\n")
         run = AggregationGUI(files, working_directory)
         run.file_analysis()
+        show_progress()
 
 
     # GUI start! =====
@@ -2648,6 +2348,7 @@ choose:\n\nFile > Download sample data"
     write_to_textwall(instructions)
 
     root.config(menu = menubar)
+    root.after(int(progress.interval * 1000), poll_progress)
 
     # from tkinter source:
     #root.iconify()
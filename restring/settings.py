@@ -3,6 +3,14 @@ import os
 # separator for text tables
 sep = "\t"
 
+# pandas parser used to read the String tables: "c", or "pyarrow" if
+# the pyarrow package is installed
+read_engine = "c"
+
+# progress events (see gears.Progress) are shown at most this often, in
+# seconds
+progress_interval = 0.1
+
 # working directory
 PATH = os.getcwd()
 
@@ -57,4 +65,51 @@ header_table = {
         "score": "false discovery rate",
         "gene name" : "matching proteins in your network (labels)"
     }
-}
\ No newline at end of file
+}
+# STRING API ===
+# latest STRING release
+string_api_url = "https://string-db.org/api"
+
+# connections kept open to each STRING server (see apigears.EnrichmentClient)
+api_pool_size = 10
+
+# seconds to wait for STRING to (connect, reply)
+api_timeout = (10, 300)
+
+# queries sent to STRING, at most this many per second on average, and
+# this many at once after a pause (see apigears.TokenBucket). STRING asks
+# for one query per second
+api_rate = 1.0
+api_burst = 1
+
+# queries to STRING kept in flight at the same time (see apigears.fetch_all)
+api_workers = 4
+
+# with EnrichmentClient(cache=True), STRING replies are kept on disk in this
+# folder (see apigears.ResponseCache), up to this many bytes: the least
+# recently used go first. None: no cache
+api_cache_dir = os.path.join(os.path.expanduser("~"), ".restring", "string_cache")
+api_cache_size = 512 * 2**20
+
+# seconds a reply from the latest STRING release (string_api_url) is kept:
+# it changes with new releases. Replies from a given STRING version, like
+# https://version-11-5.string-db.org/api, are kept until evicted
+api_cache_ttl = 7 * 24 * 3600
+
+# STRING queries failing for reasons that may go away (HTTP 429 and 5xx,
+# timeouts, lost connections) are tried again up to api_retries times,
+# waiting about api_backoff, 2*api_backoff, 4*api_backoff.. seconds (at
+# most api_backoff_max), shortened at random so that threads don't retry
+# together
+api_retries = 4
+api_backoff = 1.0
+api_backoff_max = 60
+
+# after this many failures in a row, no query is sent to STRING for
+# api_breaker_cooldown seconds (see apigears.CircuitBreaker)
+api_breaker_threshold = 5
+api_breaker_cooldown = 60
+
+# the queries of a batch still failing are put aside, and tried again after
+# the others: until this many rounds in a row get none of them through
+api_retry_rounds = 3
@@ -48,10 +48,14 @@ setup(
         'matplotlib',
         'seaborn',
         'pandas',
+        'numpy>=1.17', # np.unpackbits(bitorder=)
         'requests',
       ],
     entry_points={
-        'console_scripts': ['restring-gui=restring.restring:restring_gui'],
+        'console_scripts': [
+            'restring-gui=restring.restring:restring_gui',
+            'restring-reduce=restring.reduce:main',
+        ],
     },
     include_package_data=True, # processes MANIFEST.in
 )